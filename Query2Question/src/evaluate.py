@@ -1,6 +1,8 @@
+import os
 import re
+import sys
 import json
-import requests
+import argparse
 import urllib.parse
 import csv
 
@@ -10,24 +12,51 @@ import matplotlib.pyplot as plt
 
 from numpy import NaN
 
+# Repository root, holding the dataset and the generator's cache, client and batching modules
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+TEST_QUESTIONS = os.path.join(ROOT, "data", "DBLP-QuAD", "test", "questions.json")
+
 class DBLPServer:
     """
         DBLP Server class
     """
-    def __init__(self, path):
+    def __init__(self, path, cache=None, client=None):
         with open(path, "r", encoding="utf-8") as f:
             self.host = json.load(f)["host"]
         self.result_format = "json"
+        self.cache = cache
+        if client is None:
+            from client import SPARQLClient
+            client = SPARQLClient()
+        self.client = client
     
     def query(self, query):
         """
-            Query the DBLP server
+            Query the DBLP server, or the result cache if the query was answered before
+        """
+        return self.answers(self.fetch(query))
+
+    def fetch(self, query, cached=True):
+        """
+            Return the server's result for a query, or None if the request failed.
+            The cache is bypassed if cached is False
         """
-        url = f"{self.host}/sparql?query={urllib.parse.quote(query)}&format=application%2Fsparql-results%2B{self.result_format}"
-        response = requests.get(url)
-        if response.status_code == 200:
+        result = self.cache.get(query) if self.cache is not None and cached else None
+        if result is None:
+            url = f"{self.host}/sparql?query={urllib.parse.quote(query)}&format=application%2Fsparql-results%2B{self.result_format}"
+            response = self.client.get(url)
+            if response is None or response.status_code != 200:
+                return None
             result = json.loads(response.text)
+            if self.cache is not None and cached:
+                self.cache.put(query, result)
+        return result
 
+    def answers(self, result):
+        """
+            Return the result if it holds answers, else {}
+        """
+        if result:
             if "boolean" in result.keys():
                 return result
             elif "results" in result.keys():
@@ -52,34 +81,56 @@ def clean_query(query):
     query = query.replace("  ", " ")
     return query 
 
-def run_queries(model):
+def get_template_ids(header, rows, questions_path):
+    """
+        Template ids of the prediction rows, from a template_id column of the
+        predictions or else by row index in the questions file. None where they
+        are not known, so that the query is sent alone
+    """
+    if "template_id" in header:
+        column = header.index("template_id")
+        return [row[column] or None for row in rows]
+    if not os.path.exists(questions_path):
+        print(f"No template ids in the predictions and no {questions_path}, sending queries one at a time")
+        return [None] * len(rows)
+    with open(questions_path, "r", encoding="utf-8") as f:
+        questions = json.load(f)["questions"]
+    return [questions[int(row[0])]["template_id"] if int(row[0]) < len(questions) else None for row in rows]
+
+def run_queries(model, questions_path=TEST_QUESTIONS):
     """
         Run generated queries
     """
+    from cache import QueryCache
+    from batching import QueryBatcher
 
     TOTAL_QUERIES = 0
 
-    dblp_server = DBLPServer("../../config.json")
+    dblp_server = DBLPServer(os.path.join(ROOT, "config.json"), QueryCache(os.path.join(ROOT, "dblp.cache.sqlite")))
+    batcher = QueryBatcher(dblp_server)
+
+    with open(model+"-outputs/predictions.csv", "r", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+
+    # Queries of the same template are sent in VALUES batches
+    template_ids = get_template_ids(header, rows, questions_path)
+    pred_answers = batcher.query([(template_id, clean_query(row[1])) for template_id, row in zip(template_ids, rows)])
+    act_answers = batcher.query([(template_id, clean_query(row[2])) for template_id, row in zip(template_ids, rows)])
 
     with open("../"+model+"-data/predicted_answers.json", "w+", encoding="utf-8") as pred_file:
         with open("../"+model+"-data/actual_answers.json", "w+", encoding="utf-8") as act_file:
             pred_file.write('{\n"answers":[')
             act_file.write('{\n"answers":[')
-            with open(model+"-outputs/predictions.csv", "r", encoding="utf-8") as f:
-                reader = csv.reader(f)
-                next(reader)
-                for row in reader:
-                    TOTAL_QUERIES += 1
-                    generated_query = clean_query(row[1])
-                    actual_query = clean_query(row[2])
-                    pred_answer = dblp_server.query(generated_query)
-                    pred_answer['id'] = row[0]       
-                    json.dump(pred_answer, pred_file, indent=4, ensure_ascii=False)
-                    pred_file.write(",\n")
-                    act_answer = dblp_server.query(actual_query)
-                    act_answer['id'] = row[0]
-                    json.dump(act_answer, act_file, indent=4, ensure_ascii=False)
-                    act_file.write(",\n")
+            for row, pred_answer, act_answer in zip(rows, pred_answers, act_answers):
+                TOTAL_QUERIES += 1
+                pred_answer['id'] = row[0]
+                json.dump(pred_answer, pred_file, indent=4, ensure_ascii=False)
+                pred_file.write(",\n")
+                act_answer['id'] = row[0]
+                json.dump(act_answer, act_file, indent=4, ensure_ascii=False)
+                act_file.write(",\n")
             pred_file.seek(pred_file.tell() - 2, 0)
             pred_file.truncate()
             pred_file.write("]}")
@@ -87,6 +138,9 @@ def run_queries(model):
             act_file.truncate()
             act_file.write("]}")
 
+    batcher.report()
+    dblp_server.cache.report()
+    dblp_server.client.report()
     return TOTAL_QUERIES
 
 def get_answer(answer):
@@ -301,10 +355,17 @@ def calculate_f1(model):
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--run_queries", action="store_true", help="Answer the predicted and actual queries with the DBLP server")
+    parser.add_argument("--questions", type=str, default=TEST_QUESTIONS, help="Test questions the prediction rows are indexed into")
+    parser.add_argument("--generator_path", type=str, default=ROOT, help="Directory of the generator's cache, client and batching modules")
+    args = parser.parse_args()
+
+    sys.path.append(args.generator_path)
+
     for model in ["t5-small", "t5-base"]:
         print("\n Model: ", model)
-        # TOTAL_QUERIES = run_queries(model)
-        TOTAL_QUERIES = 2000
+        TOTAL_QUERIES = run_queries(model, args.questions) if args.run_queries else 2000
         calculate_accuracy(model, TOTAL_QUERIES)
         calculate_f1(model)
                 
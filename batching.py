@@ -0,0 +1,188 @@
+"""
+    Batched execution of filled templates: queries of the same template are
+    sent as one SPARQL query with a VALUES block binding each query's slots
+    next to a key column, and the bindings are split back per query
+"""
+import logging
+
+from templates import templates
+from executors import CompiledTemplate, SLOT, slot_name
+
+logging.basicConfig(level=logging.INFO)
+
+KEY = "batchkey"
+
+
+def contains(node, kind):
+    """
+        Whether a parsed query has an element or expression of a kind
+    """
+    if isinstance(node, tuple):
+        return (len(node) > 0 and node[0] == kind) or any(contains(part, kind) for part in node)
+    if isinstance(node, list):
+        return any(contains(part, kind) for part in node)
+    if isinstance(node, dict):
+        return any(contains(value, kind) for value in node.values())
+    return False
+
+
+def values_term(term):
+    """
+        SPARQL syntax of a slot term in a VALUES row, or None if it cannot be written there
+    """
+    if isinstance(term, int):
+        return str(term)
+    if term.startswith('"') and '"' in term[1:-1]:
+        return None
+    return term
+
+
+class BatchTemplate:
+    """
+        A template rewritten to answer many slot bindings in one query.
+        ASK templates become a SELECT of the keys for which the pattern holds
+    """
+    def __init__(self, template):
+        self.compiled = CompiledTemplate(template)
+        parsed = self.compiled.parsed
+        self.form = parsed["form"]
+        self.variables = [variable for variable, _ in parsed.get("projection", [])]
+        self.slots = list(self.compiled.placeholders)
+
+        self.batchable = bool(self.slots) and not (
+            contains(parsed, "subquery") or contains(parsed, "aggregate")
+            or self.form == "SELECT" and (
+                "*" in self.variables or parsed["group_by"] or parsed["order_by"]
+                or parsed["limit"] is not None or parsed["offset"]))
+        if not self.batchable:
+            return
+
+        sparql = template["query"]["sparql"]
+        brace = sparql.index("{")
+        head, self.body = sparql[:brace], SLOT.sub(lambda match: "?" + slot_name(match.group()), sparql[brace + 1:])
+        if self.form == "ASK":
+            self.head = f"SELECT DISTINCT ?{KEY} WHERE "
+        else:
+            select = "SELECT DISTINCT " if parsed["distinct"] else "SELECT "
+            self.head = select + f"?{KEY} " + head[head.upper().index("SELECT") + len(select):]
+        self.distinct = parsed["distinct"] if self.form == "SELECT" else False
+
+    def __repr__(self):
+        return f"BatchTemplate(id={self.compiled.id}, batchable={self.batchable})"
+
+    def row(self, query):
+        """
+            Return the VALUES row terms of a filled query, or None if it cannot be batched
+        """
+        parameters = self.compiled.bind(query)
+        if parameters is None:
+            return None
+        row = [values_term(parameters[slot]) for slot in self.slots]
+        return None if None in row else row
+
+    def query(self, rows):
+        """
+            Batched query for the VALUES rows, keyed by their position
+        """
+        variables = " ".join(f"?{variable}" for variable in [KEY] + self.slots)
+        values = " ".join("(" + " ".join([str(key)] + row) + ")" for key, row in enumerate(rows))
+        return f"{self.head}{{ VALUES ({variables}) {{ {values} }} {self.body}"
+
+    def split(self, result, count):
+        """
+            Split the result of a batched query into the results of its count queries
+        """
+        bindings = [[] for _ in range(count)]
+        for binding in result.get("results", {}).get("bindings", []):
+            key = int(binding.pop(KEY)["value"])
+            bindings[key].append(binding)
+
+        if self.form == "ASK":
+            return [{"head": {"link": []}, "boolean": bool(rows)} for rows in bindings]
+        return [{
+            "head": {"link": [], "vars": self.variables},
+            "results": {"distinct": self.distinct, "ordered": True, "bindings": rows}
+        } for rows in bindings]
+
+
+class QueryBatcher:
+    """
+        Execute (template id, query) pairs against a DBLPServer, batching up to
+        batch_size queries of the same template into one request. Queries that
+        cannot be batched, and batches the server fails to answer, are sent alone
+    """
+    def __init__(self, server, batch_size=20):
+        self.server = server
+        self.batch_size = batch_size
+        self.batches = 0
+        self.batched = 0
+        self.single = 0
+        self.templates = {}
+        for entity_type in templates.values():
+            for query_type in entity_type.values():
+                for template in query_type:
+                    self.templates[template["id"]] = BatchTemplate(template)
+
+    def __repr__(self):
+        return f"QueryBatcher(batch_size={self.batch_size}, batches={self.batches}, batched={self.batched}, single={self.single})"
+
+    def fetch(self, items):
+        """
+            Return the server's results for (template id, query) pairs, None where a request failed
+        """
+        results = [None] * len(items)
+        groups = {}
+        for index, (template_id, query) in enumerate(items):
+            template = self.templates.get(template_id)
+            row = template.row(query) if template and template.batchable else None
+            if row is None:
+                results[index] = self.server.fetch(query)
+                self.single += 1
+                continue
+            cached = self.server.cache.get(query) if self.server.cache is not None else None
+            if cached is not None:
+                results[index] = cached
+            else:
+                groups.setdefault(template_id, []).append((index, row))
+
+        for template_id, members in groups.items():
+            template = self.templates[template_id]
+            for start in range(0, len(members), self.batch_size):
+                chunk = members[start:start + self.batch_size]
+                for (index, _), result in zip(chunk, self.fetch_batch(template, chunk, items)):
+                    results[index] = result
+        return results
+
+    def fetch_batch(self, template, chunk, items):
+        """
+            Fetch a chunk of (index, row) pairs of a template as one batched query
+        """
+        queries = [items[index][1] for index, _ in chunk]
+        results = None
+        if len(chunk) > 1:
+            result = self.server.fetch(template.query([row for _, row in chunk]), cached=False)
+            if result is not None and "results" in result:
+                self.batches += 1
+                self.batched += len(chunk)
+                results = template.split(result, len(chunk))
+            else:
+                logging.debug(f" Batch of {template.compiled.id} failed, sending {len(chunk)} queries alone")
+
+        if results is None:
+            self.single += len(chunk)
+            results = [self.server.fetch(query, cached=False) for query in queries]
+        if self.server.cache is not None:
+            # Rejected queries come back as empty results and are not cached
+            for query, result in zip(queries, results):
+                if result:
+                    self.server.cache.put(query, result)
+        return results
+
+    def query(self, items):
+        """
+            Return the answers to (template id, query) pairs, as DBLPServer.query would
+        """
+        return [self.server.answers(result) for result in self.fetch(items)]
+
+    def report(self):
+        logging.info(f" Sent {self.batched} queries in {self.batches} batches and {self.single} alone")
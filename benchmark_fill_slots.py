@@ -0,0 +1,80 @@
+"""
+    Microbenchmark of DataGenerator.fill_slots against substituting the
+    slots one at a time with str.replace, on the same samples and random streams
+"""
+import time
+import random
+import argparse
+from itertools import combinations
+
+from templates import templates
+from models import DataGenerator
+from utils import load_graph, load_template_index, load_keyword_index
+
+
+def replace_slots(generator, template, first_sample, second_sample, group, rng):
+    """
+        Fill the slots by replacing each placeholder in every string in turn
+    """
+    slots = generator.slot_values(first_sample, second_sample, rng)
+
+    question_strings = template["question"]["strings"].copy()
+    paraphrase_pairs = list(combinations(question_strings, 2))
+    if group == "train":
+        question_strings.pop(1)
+        question_strings.pop(2)
+    question, paraphrase = rng.sample(question_strings, 2)
+    query = template["query"]["sparql"]
+
+    for placeholder, value in slots.items():
+        question, paraphrase = [each.replace(placeholder, str(rng.choice(value))) for each in [question, paraphrase]]
+        query = query.replace(placeholder, value[0]
+            if placeholder.startswith("?") or placeholder == "[DURATION]" else "'" + str(value[0]) + "'")
+        paraphrase_pairs = [
+            (each[0].replace(placeholder, "["+str(rng.choice(value))+"]"),
+                each[1].replace(placeholder, "["+str(rng.choice(value))+"]"),
+                template["id"])
+            for each in paraphrase_pairs]
+    entities = [slots[entity][0] for entity in template["question"]["entities"]]
+    return question, paraphrase, query, entities, paraphrase_pairs
+
+
+def measure(fill, cases, group, repeat):
+    """
+        Return the best time per call of fill over the cases, and its results
+    """
+    best, results = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [fill(template, first, second, group, random.Random(seed)) for seed, template, first, second in cases]
+        elapsed = (time.perf_counter() - start) / len(cases)
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--storage", type=str, default="mmap", choices=["dict", "csr", "mmap"], help="Graph storage engine")
+    parser.add_argument("--samples", type=int, default=20, help="Samples per template")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes, the best is reported")
+    args = parser.parse_args()
+
+    graph = load_graph(args.storage)
+    generator = DataGenerator(graph, 0, load_template_index(graph), backend="local",
+                              keyword_index=load_keyword_index())
+    cases = []
+    for entity_type in templates.values():
+        for query_type in entity_type.values():
+            for template in query_type:
+                for seed in range(args.samples):
+                    first = generator.sample_generator.get("Publication", pool=generator.template_pool(template))
+                    second = generator.sample_generator.get("Publication")
+                    cases.append((seed, template, first, second))
+
+    for group in ("train", "test"):
+        compiled, compiled_results = measure(generator.fill_slots, cases, group, args.repeat)
+        replaced, replaced_results = measure(
+            lambda *case: replace_slots(generator, *case), cases, group, args.repeat)
+        assert compiled_results == replaced_results, "fill_slots differs from one slot at a time substitution"
+        print(f"{group}: {len(cases)} fills, str.replace {replaced * 1e6:.1f} us, "
+              f"compiled {compiled * 1e6:.1f} us, {replaced / compiled:.2f}x")
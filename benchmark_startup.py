@@ -0,0 +1,65 @@
+"""
+    Cold-start benchmark of the main.py modes: each run is a fresh
+    interpreter importing main and loading the resources the mode needs
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+HEAVY_MODULES = ["spacy", "pandas", "seaborn", "matplotlib"]
+
+# Resources each mode loads before doing any work
+MODES = {
+    "import": "",
+    "index": "models.load_nlp()",
+    "generate": "models.load_core(); utils.load_template_index(); utils.load_keyword_index()",
+    "generate_paraphrases": "models.load_core(); utils.load_template_index(); utils.load_keyword_index()",
+    "check_compiled": "models.load_core(); utils.load_template_index()",
+    "stats": "import seaborn, pandas"
+}
+
+SCRIPT = """
+import sys, json, time, logging
+start = time.perf_counter()
+import main, models, utils
+imported = time.perf_counter() - start
+logging.disable(logging.INFO)
+{load}
+print(json.dumps({{"import": imported, "total": time.perf_counter() - start,
+    "heavy": [name for name in {heavy} if name in sys.modules]}}))
+"""
+
+
+def measure(mode, repeat):
+    """
+        Return the import and total times of a mode's cold starts, and the heavy modules loaded
+    """
+    runs = []
+    for _ in range(repeat):
+        script = SCRIPT.format(load=MODES[mode], heavy=HEAVY_MODULES)
+        process = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+        if process.returncode:
+            raise RuntimeError(process.stderr.strip().splitlines()[-1])
+        runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+    return (
+        statistics.median(run["import"] for run in runs),
+        statistics.median(run["total"] for run in runs),
+        runs[-1]["heavy"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5, help="Cold starts per mode")
+    parser.add_argument("modes", nargs="*", default=list(MODES), help="Modes to measure")
+    args = parser.parse_args()
+
+    print(f"{'mode':<22}{'import (s)':>12}{'startup (s)':>13}  heavy modules")
+    for mode in args.modes:
+        try:
+            imported, total, heavy = measure(mode, args.repeat)
+        except RuntimeError as error:
+            print(f"{mode:<22}{'failed':>12}{'':>13}  {error}")
+            continue
+        print(f"{mode:<22}{imported:>12.3f}{total:>13.3f}  {', '.join(heavy) or '-'}")
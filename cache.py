@@ -0,0 +1,122 @@
+"""
+    Persistent cache of SPARQL query results in front of the DBLP server
+"""
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO)
+
+# Quoted literals are kept as they are, whitespace elsewhere is collapsed
+LITERALS = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")""")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """
+        Normalize a query string so that formatting differences share a cache entry
+    """
+    parts = LITERALS.split(query.strip())
+    return "".join(part if index % 2 else WHITESPACE.sub(" ", part) for index, part in enumerate(parts))
+
+
+class QueryCache:
+    """
+        Query results stored in an SQLite database, keyed by the normalized
+        query. The least recently used entries are evicted once the results
+        exceed max_size bytes, and entries older than ttl seconds expire
+    """
+    def __init__(self, path, max_size=1024 ** 3, ttl=None):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "query TEXT PRIMARY KEY, result TEXT, size INTEGER, created REAL, accessed REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        self.connection.commit()
+        self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def __repr__(self):
+        return f"QueryCache(path={self.path}, size={self.size}, hits={self.hits}, misses={self.misses})"
+
+    def count(self):
+        """
+            Return the number of cached results
+        """
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get(self, query):
+        """
+            Return the cached result of a query, or None on a miss
+        """
+        key = normalize_query(query)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT result, size, created FROM results WHERE query = ?", (key,)).fetchone()
+            if row and self.ttl is not None and now - row[2] > self.ttl:
+                self.connection.execute("DELETE FROM results WHERE query = ?", (key,))
+                self.connection.commit()
+                self.size -= row[1]
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE results SET accessed = ? WHERE query = ?", (now, key))
+            self.connection.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, query, result):
+        """
+            Store the result of a query, evicting least recently used entries if needed
+        """
+        key = normalize_query(query)
+        value = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT size FROM results WHERE query = ?", (key,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", (key, value, len(value), now, now))
+            self.size += len(value) - (row[0] if row else 0)
+            if self.size > self.max_size:
+                self.__evict()
+            self.connection.commit()
+
+    def __evict(self):
+        """
+            Delete least recently used entries until the cache fits in max_size
+        """
+        cursor = self.connection.execute("SELECT query, size FROM results ORDER BY accessed")
+        evicted = []
+        for key, size in cursor:
+            if self.size <= self.max_size:
+                break
+            evicted.append((key,))
+            self.size -= size
+        self.connection.executemany("DELETE FROM results WHERE query = ?", evicted)
+        logging.debug(f" Evicted {len(evicted)} cached results")
+
+    def hit_rate(self):
+        """
+            Return the fraction of lookups answered from the cache
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        logging.info(f" Query cache: {self.hits} hits, {self.misses} misses ({self.hit_rate():.2%} hit rate)")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,98 @@
+"""
+    Checkpoints of long generation runs, so that a run can resume after
+    the last completed question instead of starting over
+"""
+import os
+import json
+import copy
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO)
+
+
+class Checkpoint:
+    """
+        Progress of generating a group, saved to a JSON file every `every` valid
+        questions: the valid and invalid question counts of every bucket, the ID
+        counters and the positions of the output writers. A question slot draws
+        from its own random stream, so a bucket's valid count is also the number
+        of its slots that are complete and no random state has to be saved.
+        Abandoned buckets are saved with the number of slots they completed, so
+        that a resumed run does not attempt their remaining slots again.
+        settings are saved along and must match when the checkpoint is resumed
+    """
+    def __init__(self, path, entity_types, query_types, every=1000, **settings):
+        self.path = path
+        self.every = every
+        self.settings = settings
+        self.state = {
+            "settings": settings,
+            "valid_query_count_dict": {entity_type: {query_type: 0 for query_type in query_types} for entity_type in entity_types},
+            "invalid_query_count_dict": {entity_type: {query_type: 0 for query_type in query_types} for entity_type in entity_types},
+            "valid_query_index": 0,
+            "invalid_query_index": 0,
+            "abandoned": {entity_type: {} for entity_type in entity_types},
+            "outputs": {},
+            "done": False
+        }
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Checkpoint(path={self.path}, questions={self.state['valid_query_index']}, done={self.state['done']})"
+
+    def load(self):
+        """
+            Continue from the saved checkpoint if there is one.
+            Return whether it was found
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state["settings"] != self.settings:
+            raise ValueError(
+                f"Checkpoint {self.path} was saved with {state['settings']}, cannot resume with {self.settings}")
+        self.state = state
+        logging.info(f" Resuming from {self.path} after {state['valid_query_index']} questions")
+        return True
+
+    def resume_state(self):
+        """
+            Return a copy of the counts and ID counters to continue generating from
+        """
+        return copy.deepcopy({key: value for key, value in self.state.items() if key not in ("settings", "outputs", "done")})
+
+    def record(self, entity_type, query_type, valid):
+        """
+            Count a written question. Return whether a checkpoint is due,
+            which is only after a valid question since that completes its slot
+        """
+        if valid:
+            self.state["valid_query_index"] += 1
+            self.state["valid_query_count_dict"][entity_type][query_type] += 1
+            return bool(self.every) and self.state["valid_query_index"] % self.every == 0
+        self.state["invalid_query_index"] += 1
+        self.state["invalid_query_count_dict"][entity_type][query_type] += 1
+        return False
+
+    def abandon(self, entity_type, query_type, completed):
+        """
+            Record that a bucket was abandoned after its first completed slots.
+            Called by the generating thread while the writer may be saving
+        """
+        with self.lock:
+            self.state["abandoned"][entity_type][query_type] = completed
+
+    def save(self, outputs, done=False):
+        """
+            Write the checkpoint with the positions of the output writers,
+            replacing the previous one only once it is complete
+        """
+        with self.lock:
+            self.state["outputs"] = outputs
+            self.state["done"] = done
+            temporary = self.path + ".tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(self.state, f)
+            os.replace(temporary, self.path)
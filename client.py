@@ -0,0 +1,233 @@
+"""
+    HTTP client for the SPARQL endpoint with a pooled keep-alive session,
+    timeouts, retries and adaptive rate limiting
+"""
+import time
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logging.basicConfig(level=logging.INFO)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Responses telling the client to slow down
+THROTTLE_STATUS = {429, 503}
+
+
+class SPARQLError(Exception):
+    """
+        Raised when the endpoint gives no usable response, as opposed to an empty answer
+    """
+
+
+def permanent_error(response):
+    """
+        Whether a response is a client error that asking again would not fix, such as a malformed query
+    """
+    return response is not None and 400 <= response.status_code < 500 and response.status_code not in RETRY_STATUS
+
+
+def retry_after(response, default):
+    """
+        Seconds to wait before retrying, from the Retry-After header if present
+    """
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return default
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+
+class RateLimiter:
+    """
+        Token bucket limiting requests to rate per second, combined with an
+        AIMD concurrency limit: the number of requests in flight grows by one
+        per limit successes and is halved on throttling, errors or latency
+        spikes, at most once per mean latency
+    """
+    def __init__(self, rate=None, burst=None, max_concurrency=16, min_concurrency=1,
+                 decrease=0.5, spike=3.0, smoothing=0.1):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate or 1.0)
+        self.tokens = self.burst
+        self.refilled = time.monotonic()
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.decrease = decrease
+        self.spike = spike
+        self.smoothing = smoothing
+
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.mean_latency = None
+        self.decreased = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.recent_errors = 0.0
+
+    def __repr__(self):
+        return f"RateLimiter(limit={self.current_limit()}, in_flight={self.in_flight}, error_rate={self.error_rate():.2%})"
+
+    def acquire(self):
+        """
+            Block until a request may be sent
+        """
+        with self.condition:
+            while True:
+                wait = None
+                if self.in_flight >= self.current_limit():
+                    wait = 1.0
+                elif self.rate:
+                    now = time.monotonic()
+                    self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+                    self.refilled = now
+                    if self.tokens < 1:
+                        wait = (1 - self.tokens) / self.rate
+                if wait is None:
+                    break
+                self.condition.wait(wait)
+            if self.rate:
+                self.tokens -= 1
+            self.in_flight += 1
+
+    def release(self, latency, status=None):
+        """
+            Record the outcome of a request: its latency and status code, None if it failed
+        """
+        with self.condition:
+            self.in_flight -= 1
+            self.requests += 1
+            throttled = status in THROTTLE_STATUS
+            error = status is None or status >= 500 or throttled
+            self.errors += error
+            self.throttled += throttled
+            self.recent_errors += self.smoothing * (error - self.recent_errors)
+
+            spike = (not error and self.mean_latency is not None and self.requests > 10
+                and latency > self.spike * self.mean_latency)
+            if not error:
+                self.mean_latency = latency if self.mean_latency is None else (
+                    self.mean_latency + self.smoothing * (latency - self.mean_latency))
+
+            now = time.monotonic()
+            if error or spike:
+                if now - self.decreased > (self.mean_latency or 0.0):
+                    self.limit = max(self.min_concurrency, self.limit * self.decrease)
+                    self.decreased = now
+                    logging.debug(f" Concurrency limit decreased to {self.current_limit()}")
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def current_limit(self):
+        """
+            Return the number of requests allowed in flight
+        """
+        return max(self.min_concurrency, int(self.limit))
+
+    def error_rate(self):
+        """
+            Return the fraction of requests that failed or were throttled
+        """
+        return self.errors / self.requests if self.requests else 0.0
+
+    def throttle_rate(self):
+        """
+            Return the fraction of requests answered with 429 or 503
+        """
+        return self.throttled / self.requests if self.requests else 0.0
+
+    def report(self):
+        logging.info(
+            f" Rate limiter: concurrency limit {self.current_limit()}, {self.error_rate():.2%} errors "
+            f"({self.recent_errors:.2%} recent), {self.throttle_rate():.2%} throttled")
+
+
+class SPARQLClient:
+    """
+        Pooled HTTP session shared by the queries sent to the endpoint.
+        Requests time out after timeout seconds (connect, read), failed
+        requests are retried with exponential backoff, and requests are
+        paced by the rate limiter if one is given
+    """
+    def __init__(self, pool_size=16, timeout=(5, 60), retries=5, backoff=0.5, max_backoff=60, limiter=None):
+        self.timeout = timeout
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.bytes = 0
+
+    def __repr__(self):
+        return f"SPARQLClient(requests={self.requests}, retried={self.retried}, failures={self.failures})"
+
+    def get(self, url):
+        """
+            GET a URL, retrying on connection errors and retryable status codes.
+            Return the last response, or None if no response was received
+        """
+        response = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1)) * (1 + random.random() / 2)
+                time.sleep(min(self.max_backoff, retry_after(response, delay)))
+            if self.limiter:
+                self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except requests.RequestException as error:
+                logging.debug(f" Request failed: {error}")
+                response = None
+            latency = time.perf_counter() - start
+            if self.limiter:
+                self.limiter.release(latency, response.status_code if response is not None else None)
+            self.record(latency, response, retried=attempt > 0)
+            if response is not None and response.status_code not in RETRY_STATUS:
+                return response
+        with self.lock:
+            self.failures += 1
+        return response
+
+    def record(self, latency, response, retried=False):
+        with self.lock:
+            self.requests += 1
+            self.retried += retried
+            self.latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.bytes += len(response.content) if response is not None else 0
+
+    def report(self):
+        mean = self.latency / self.requests if self.requests else 0.0
+        logging.info(
+            f" SPARQL client: {self.requests} requests, {self.retried} retries, {self.failures} failures, "
+            f"{mean * 1000:.0f} ms mean / {self.max_latency * 1000:.0f} ms max latency, {self.bytes / 1024 ** 2:.1f} MB received")
+        if self.limiter:
+            self.limiter.report()
+
+    def close(self):
+        self.session.close()
@@ -2,12 +2,122 @@
     Modeling DBLP RDF data as Graph
 """
 
-import re
+import os
+import mmap
+import json
 import random
+import struct
 import pickle
+from array import array
+import numpy as np
 from tqdm import tqdm
+from multiprocessing import Pool
 import whitelist
 
+TYPE_PREDICATE = "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"
+PREDICATES = frozenset(whitelist.predicates)
+PUBLICATIONS = frozenset(whitelist.publications)
+CREATORS = frozenset(whitelist.creators)
+
+MAPPED_MAGIC = b"DBLPGRPH"
+MAPPED_VERSION = 2
+
+# Edges a publication needs for models.Sample to validate
+SAMPLE_EDGES = [
+    "<https://dblp.org/rdf/schema#title>",
+    "<https://dblp.org/rdf/schema#bibtexType>",
+    "<https://dblp.org/rdf/schema#authoredBy>",
+    "<https://dblp.org/rdf/schema#yearOfPublication>",
+    "<https://dblp.org/rdf/schema#publishedIn>"
+]
+
+def parse_ntriple(line):
+    """
+        Split an NTriple line into (subject, predicate, object)
+    """
+    parts = line.rstrip("\n").split(" ", 2)
+    if len(parts) < 3:
+        return None
+    return parts[0], parts[1], parts[2].rsplit(" ", 1)[0] # Remove last "."
+
+def classify_type(vertex):
+    """
+        Map an rdf:type object to the type it is stored under
+    """
+    type_string = vertex.rsplit("#", maxsplit=1)[-1].replace(">", "")
+    if type_string in PUBLICATIONS:
+        return "Publication"
+    if type_string in CREATORS:
+        return "Creator"
+    return None
+
+def split_ntriple(path, chunks):
+    """
+        Split an NTriple file into byte ranges. Each range starts at an
+        rdf:type triple of a new subject with a known type, which sets the
+        type context the same way the sequential loader does, so that it is
+        not cut between two chunks
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, "rb") as infile:
+        for i in range(1, chunks):
+            position = max(size * i // chunks, boundaries[-1])
+            infile.seek(position)
+            if position > 0:
+                position += len(infile.readline()) # Skip the partial line
+            previous_subject = None
+            for line in infile:
+                triple = parse_ntriple(line.decode("utf-8"))
+                if triple and triple[0] != previous_subject and not triple[0].startswith("_"):
+                    if previous_subject is not None and triple[1] == TYPE_PREDICATE and classify_type(triple[2]):
+                        break
+                    previous_subject = triple[0]
+                position += len(line)
+            boundaries.append(position)
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+def load_chunk(args):
+    """
+        Load a byte range of an NTriple file into a partial graph
+    """
+    path, start, end = args
+    return Graph().load_from_ntriple(path, start, end, progress=False).data
+
+class SubgraphView:
+    """
+        Read-only view of a vertex and its one-hop neighbours.
+        Edges and neighbours are resolved from the graph on access,
+        nothing is copied into or written back to the graph
+    """
+    def __init__(self, graph, _type, vertex):
+        self.graph = graph
+        self._type = _type
+        self.vertex = vertex
+
+    def __repr__(self):
+        return f"SubgraphView(vertex={self.vertex})"
+
+    def get(self, edge, default=None):
+        """
+            Return the objects of an edge or default if there are none
+        """
+        objects = self.graph.objects(self._type, self.vertex, edge)
+        return tuple(objects) if objects else default
+
+    def edges(self):
+        """
+            Return the edges of the vertex
+        """
+        return list(self.graph.get(self._type, self.vertex) or {})
+
+    def neighbours(self, edge):
+        """
+            Return views of the vertices connected by an edge
+        """
+        return [SubgraphView(self.graph, self._type, vertex2) for vertex2 in self.get(edge, ())]
+
 class Graph:
     """
         Graph data model
@@ -15,10 +125,18 @@ class Graph:
     def __init__(self, label=None):
         self.label = label
         self.data = {}
+        self.vertex_index = {} # type -> list of vertices for O(1) sampling
+        self.valid_index = {} # type -> list of vertices that pass sample validation
 
     def __repr__(self):
         return f"Graph(label={self.label})"
 
+    def build_index(self):
+        """
+            Build the per type vertex arrays used for sampling
+        """
+        self.vertex_index = {_type: list(vertices) for _type, vertices in self.data.items()}
+
     def add_triple(self, _type, vertex1, edge, vertex2):
         """
             Add a triple into the graph
@@ -26,7 +144,9 @@ class Graph:
         self.data.setdefault(_type, {})
 
         # Get vertex1 if exists else add with empty dict
-        self.data[_type].setdefault(vertex1, {})
+        if vertex1 not in self.data[_type]:
+            self.data[_type][vertex1] = {}
+            self.vertex_index.setdefault(_type, []).append(vertex1)
 
         # add edge if exists else add epmty list
         self.data[_type][vertex1].setdefault(edge, [])
@@ -50,25 +170,84 @@ class Graph:
         except KeyError:
             return None
 
-    def sample_vertex(self, _type, count=1):
+    def is_valid_sample(self, _type, vertex):
         """
-            Sample a n subgraphs from Graph without replacement
+            Check if a vertex has non-empty values for all sample edges
+        """
+        for edge in SAMPLE_EDGES:
+            objects = self.objects(_type, vertex, edge)
+            if not objects or not objects[0].replace('"', "").replace(".", ""):
+                return False
+        return True
+
+    def build_valid_index(self, _type="Publication"):
+        """
+            Precompute the vertices of a type that pass sample validation
+            and return the fraction of vertices that do
+        """
+        vertices = self.vertex_index.get(_type, [])
+        self.valid_index[_type] = [vertex for vertex in vertices if self.is_valid_sample(_type, vertex)]
+        return len(self.valid_index[_type]) / len(vertices) if vertices else 0.0
+
+    def pool_size(self, _type, valid=False):
+        """
+            Return the number of vertices of a type, or of valid samples if valid is set
+        """
+        return len(self.valid_index[_type] if valid else self.vertex_index[_type])
+
+    def vertex_at(self, _type, position, valid=False):
+        """
+            Return the vertex at a position of the vertex or valid sample index
+        """
+        return (self.valid_index[_type] if valid else self.vertex_index[_type])[position]
+
+    def all_vertices(self):
+        """
+            Iterate over the subject vertices of all types
         """
-        def generate_subgraph(vertex):
-            subgraph = {vertex: self.get(_type, vertex)}
-            for edge in subgraph[vertex].keys(): # Iterate over edges
-                for i, label in enumerate(subgraph[vertex][edge]):
-                    vertex2 = self.get(_type, label)
-                    if vertex2:
-                        subgraph[vertex][edge][i] = {label: vertex2}
-            return subgraph
+        for vertices in self.vertex_index.values():
+            yield from vertices
 
-        vertices = random.sample(self.data[_type].keys(), count)
-        return generate_subgraph(vertices[0]) if count == 1 else [
-                generate_subgraph(vertex) for vertex in vertices
-            ]
+    def random_vertex(self, _type, valid=False, rng=random):
+        """
+            Return a uniformly sampled vertex of the given type in O(1),
+            only from the valid sample index if valid is set
+        """
+        return self.vertex_at(_type, rng.randrange(self.pool_size(_type, valid)), valid)
 
-    def sample_triples(self, _type, hops=2):
+    def random_vertices(self, _type, count, valid=False, pool=None, rng=random):
+        """
+            Return count uniformly sampled vertices of the given type
+            without replacement in O(count). If pool is given, only the
+            index positions it contains are sampled
+        """
+        positions = rng.sample(range(len(pool) if pool is not None else self.pool_size(_type, valid)), count)
+        if pool is not None:
+            positions = [int(pool[position]) for position in positions]
+        return [self.vertex_at(_type, position, valid) for position in positions]
+
+    def objects(self, _type, vertex, edge):
+        """
+            Return the objects of one edge of the given vertex
+        """
+        edges = self.get(_type, vertex)
+        return edges.get(edge, []) if edges else []
+
+    def subgraph(self, _type, vertex):
+        """
+            Return a read-only view of a vertex and its one-hop neighbours
+        """
+        return SubgraphView(self, _type, vertex)
+
+    def sample_vertex(self, _type, count=1, rng=random):
+        """
+            Sample a n subgraphs from Graph without replacement
+        """
+        if count == 1:
+            return self.subgraph(_type, self.random_vertex(_type, rng=rng))
+        return [self.subgraph(_type, vertex) for vertex in self.random_vertices(_type, count, rng=rng)]
+
+    def sample_triples(self, _type, hops=2, rng=random):
         """
             Sample a triple from Graph with n hops
         """
@@ -80,89 +259,506 @@ class Graph:
 
             if hop == 0:
                 triple_sequence = []
-                subgraph = self.sample_vertex(_type)
+                subgraph = self.sample_vertex(_type, rng=rng)
             else:
                 vertex = triple_sequence[-1][-1]
-                subgraph = {vertex: self.get(_type, vertex)}
-                if subgraph[vertex] is None: # If vertex2 is None return
+                if self.get(_type, vertex) is None: # If vertex2 is None return
                     return triple_sequence
+                subgraph = self.subgraph(_type, vertex)
 
-            vertex1 = next(iter(subgraph)) # Get vertex name
-            edges = subgraph[vertex1].keys() # Get all edges
+            vertex1 = subgraph.vertex # Get vertex name
+            edges = subgraph.edges() # Get all edges
             filtered_edges = edges if hop==hops-1 else filter_edges(edges) # Filter edges
 
             if not filtered_edges:
                 if hop==0:
-                    edge = random.sample(edges, 1)[0]
-                    vertex2 = random.sample(subgraph[vertex1][edge], 1)[0]
+                    edge = rng.sample(edges, 1)[0]
+                    vertex2 = rng.sample(subgraph.get(edge), 1)[0]
                     triple_sequence.append([vertex1, edge, vertex2])
                 return triple_sequence
 
-            edge = random.sample(filtered_edges, 1)[0] # Sample an edge for vertex1
-            vertex2 = random.sample(subgraph[vertex1][edge], 1)[0] # Sample a vertex2 for an edge
+            edge = rng.sample(filtered_edges, 1)[0] # Sample an edge for vertex1
+            vertex2 = rng.sample(subgraph.get(edge), 1)[0] # Sample a vertex2 for an edge
             triple_sequence.append([vertex1, edge, vertex2])
 
         return triple_sequence
 
-    def load_from_ntriple(self, path):
+    def load_from_ntriple(self, path, start=0, end=None, progress=True):
         """
-            Load triples into the graph from NTriple file
+            Load triples into the graph from NTriple file,
+            optionally restricted to the byte range [start, end)
         """
+        _type = None
 
-        type_predicate = "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"
+        with open(path, "rb") as infile:
+            infile.seek(start)
+            position = start
 
-        def parse(line):
-            parts = line.split(" ")
-            vertex1, edge = parts[0], parts[1]
-            vertex2 = " ".join(parts[2:-1]) # Remove last "."
-            return vertex1, edge, vertex2
+            for line in tqdm(infile, desc="Loading", disable=not progress):
 
-        def classify_type(vertex):
-            type_string = re.sub(">", "", vertex.rsplit("#", maxsplit=1)[-1])
-            if type_string in whitelist.publications:
-                return "Publication"
-            if type_string in whitelist.creators:
-                return "Creator"
-            return None
+                if end is not None and position >= end:
+                    break
+                position += len(line)
+
+                triple = parse_ntriple(line.decode("utf-8"))
+                if triple is None:
+                    continue
 
-        with open(path, encoding="utf-8") as infile:
+                vertex1, edge, vertex2 = triple
 
-            for triple in tqdm(infile, desc="Loading"):
+                if vertex1.startswith("_"): # Ignore IDs and Lists
+                    continue
 
-                if len(triple.split(" ")) > 1:
+                if edge == TYPE_PREDICATE:
 
-                    vertex1, edge, vertex2 = parse(triple)
+                    extracted_type = classify_type(vertex2)
 
-                    if vertex1.startswith("_"): # Ignore IDs and Lists
+                    if extracted_type == "Creator": # Don't store Creator sub-classes
+                        _type = "Creator"
                         continue
 
-                    if edge == type_predicate:
+                    # Ignore other types but save prior type string
+                    _type = extracted_type if extracted_type else _type
 
-                        extracted_type = classify_type(vertex2)
+                if edge in PREDICATES and _type is not None:
+                    self.add_triple(_type, vertex1, edge, vertex2)
 
-                        if extracted_type == "Creator": # Don't store Creator sub-classes
-                            _type = "Creator"
-                            continue
+        return self
 
-                        # Ignore other types but save prior type string
-                        _type = extracted_type if extracted_type else _type
+    def load_from_ntriple_parallel(self, path, workers):
+        """
+            Load triples into the graph from NTriple file using a pool of
+            worker processes, each parsing a chunk aligned on subject boundaries
+        """
+        chunks = split_ntriple(path, workers)
+        with Pool(workers) as pool:
+            for data in tqdm(pool.imap(load_chunk, [(path, start, end) for start, end in chunks]),
+                             total=len(chunks), desc="Loading chunks"):
+                self.merge(data)
+        return self
+
+    def merge(self, data):
+        """
+            Merge the data of a partial graph into the graph
+        """
+        for _type, vertices in data.items():
+            self.data.setdefault(_type, {})
+            for vertex1, edges in vertices.items():
+                if vertex1 not in self.data[_type]:
+                    self.data[_type][vertex1] = edges
+                    self.vertex_index.setdefault(_type, []).append(vertex1)
+                    continue
+                for edge, vertices2 in edges.items():
+                    self.data[_type][vertex1].setdefault(edge, []).extend(vertices2)
+
+    def load_from_pickle(self, file):
+        """
+            Load graph from pickle file
+        """
+        with open(file, "rb") as loadfile:
+            data = pickle.load(loadfile)
+            # Older pickles only hold the data dict
+            self.data = data["data"] if "data" in data else data
+            self.valid_index = data.get("valid_index", {}) if "data" in data else {}
+            self.build_index()
+            print("Graph loaded from ", file)
+
+    def save(self, file):
+        """
+            save data to a pickle file
+        """
+        with open(file,"wb") as savefile:
+            pickle.dump({"data": self.data, "valid_index": self.valid_index}, savefile)
+            print("Graph saved to ", file)
 
-                    if edge in whitelist.predicates:
-                        self.add_triple(_type, vertex1, edge, vertex2)
 
+class CSRGraph(Graph):
+    """
+        Graph data model with vertices and predicates interned to integer IDs
+        and adjacency stored as compressed sparse row (CSR) arrays
+    """
+    def __init__(self, label=None):
+        super().__init__(label)
+        self.vertices = []              # vertex id -> URI or literal
+        self.vertex_ids = {}            # URI or literal -> vertex id
+        self.predicates = []            # predicate id -> predicate URI
+        self.predicate_ids = {}         # predicate URI -> predicate id
+        self.vertex_types = array("b")  # vertex id -> type id (-1 if not a subject)
+        self.vertex_rows = array("i")   # vertex id -> row within its type (-1 if not a subject)
+        self.types = []                 # type id -> type name
+        self.subjects = {}              # type -> array of subject vertex ids, indexed by row
+        self.adjacency = {}             # type -> predicate id -> (offsets, targets)
+        self.pending = {}               # type -> predicate id -> (rows, targets) not yet compacted
+
+    def __repr__(self):
+        return f"CSRGraph(label={self.label})"
+
+    def intern_vertex(self, vertex):
+        """
+            Return the integer ID of a vertex, adding it if unseen
+        """
+        vertex_id = self.vertex_ids.get(vertex)
+        if vertex_id is None:
+            vertex_id = len(self.vertices)
+            self.vertex_ids[vertex] = vertex_id
+            self.vertices.append(vertex)
+            self.vertex_types.append(-1)
+            self.vertex_rows.append(-1)
+        return vertex_id
+
+    def intern_predicate(self, edge):
+        """
+            Return the integer ID of a predicate, adding it if unseen
+        """
+        predicate_id = self.predicate_ids.get(edge)
+        if predicate_id is None:
+            predicate_id = len(self.predicates)
+            self.predicate_ids[edge] = predicate_id
+            self.predicates.append(edge)
+        return predicate_id
+
+    def lookup(self, vertex):
+        """
+            Return the integer ID of a vertex or None if unknown
+        """
+        return self.vertex_ids.get(vertex)
+
+    def label_of(self, vertex_id):
+        """
+            Return the URI or literal of a vertex ID
+        """
+        return self.vertices[vertex_id]
+
+    def add_triple(self, _type, vertex1, edge, vertex2):
+        """
+            Add a triple into the graph
+        """
+        if _type not in self.subjects:
+            self.types.append(_type)
+            self.subjects[_type] = array("i")
+            self.adjacency[_type] = {}
+            self.pending[_type] = {}
+
+        vertex1_id = self.intern_vertex(vertex1)
+        vertex2_id = self.intern_vertex(vertex2)
+        predicate_id = self.intern_predicate(edge)
+
+        # A vertex keeps the type it was first added with
+        row = self.vertex_rows[vertex1_id]
+        if row == -1:
+            row = len(self.subjects[_type])
+            self.subjects[_type].append(vertex1_id)
+            self.vertex_types[vertex1_id] = self.types.index(_type)
+            self.vertex_rows[vertex1_id] = row
+        else:
+            _type = self.types[self.vertex_types[vertex1_id]]
+
+        rows, targets = self.pending[_type].setdefault(predicate_id, (array("i"), array("i")))
+        rows.append(row)
+        targets.append(vertex2_id)
+
+    def compact(self):
+        """
+            Merge pending triples into the CSR arrays
+        """
+        for _type, pending in self.pending.items():
+            num_rows = len(self.subjects[_type])
+            for predicate_id, (rows, targets) in pending.items():
+                rows = np.frombuffer(rows, dtype=np.int32)
+                targets = np.frombuffer(targets, dtype=np.int32)
+
+                if predicate_id in self.adjacency[_type]:
+                    old_offsets, old_targets = self.adjacency[_type][predicate_id]
+                    old_rows = np.repeat(
+                        np.arange(len(old_offsets) - 1, dtype=np.int32), np.diff(old_offsets))
+                    rows = np.concatenate([old_rows, rows])
+                    targets = np.concatenate([old_targets, targets])
+
+                # Stable sort keeps the insertion order of objects within a row
+                order = np.argsort(rows, kind="stable")
+                offsets = np.zeros(num_rows + 1, dtype=np.int64)
+                np.cumsum(np.bincount(rows, minlength=num_rows), out=offsets[1:])
+                self.adjacency[_type][predicate_id] = (offsets, targets[order])
+            self.pending[_type] = {}
+
+    def locate(self, vertex):
+        """
+            Return the (type, row) of a subject vertex or None if unknown
+        """
+        vertex_id = self.lookup(vertex) if isinstance(vertex, str) else None
+        if vertex_id is None or self.vertex_rows[vertex_id] == -1:
+            return None
+
+        if any(self.pending.values()):
+            self.compact()
+
+        return self.types[self.vertex_types[vertex_id]], int(self.vertex_rows[vertex_id])
+
+    def row_objects(self, offsets, targets, row):
+        """
+            Return the objects of a row in one CSR adjacency
+        """
+        if row + 1 >= len(offsets):
+            return []
+        return [self.label_of(target) for target in targets[offsets[row]:offsets[row + 1]].tolist()]
+
+    def get(self, _type, vertex):
+        """
+            Return edges and connections for the given vertex
+        """
+        location = self.locate(vertex)
+        if location is None:
+            return None
+
+        vertex_type, row = location
+        edges = {}
+        for predicate_id, (offsets, targets) in self.adjacency[vertex_type].items():
+            objects = self.row_objects(offsets, targets, row)
+            if objects:
+                edges[self.predicates[predicate_id]] = objects
+        return edges
+
+    def objects(self, _type, vertex, edge):
+        """
+            Return the objects of one edge of the given vertex
+        """
+        location = self.locate(vertex)
+        predicate_id = self.predicate_ids.get(edge)
+        if location is None or predicate_id is None:
+            return []
+
+        vertex_type, row = location
+        if predicate_id not in self.adjacency[vertex_type]:
+            return []
+        return self.row_objects(*self.adjacency[vertex_type][predicate_id], row)
+
+    def build_index(self):
+        """
+            Subject arrays already serve as the per type vertex index
+        """
+
+    def build_valid_index(self, _type="Publication"):
+        """
+            Precompute the vertex IDs of a type that pass sample validation
+            and return the fraction of vertices that do
+        """
+        self.compact()
+        subjects = np.frombuffer(self.subjects[_type], dtype=np.int32)
+
+        # Rows with at least one object for every sample edge
+        candidates = np.ones(len(subjects), dtype=bool)
+        for edge in SAMPLE_EDGES:
+            predicate_id = self.predicate_ids.get(edge)
+            if predicate_id is None or predicate_id not in self.adjacency[_type]:
+                candidates[:] = False
+                break
+            offsets = self.adjacency[_type][predicate_id][0]
+            counts = np.diff(offsets)
+            candidates[:len(counts)] &= counts > 0
+            candidates[len(counts):] = False
+
+        valid = [
+            row for row in np.flatnonzero(candidates).tolist()
+            if self.is_valid_sample(_type, self.label_of(subjects[row]))
+        ]
+        self.valid_index[_type] = subjects[valid]
+        return len(valid) / len(subjects) if len(subjects) else 0.0
+
+    def all_vertices(self):
+        """
+            Iterate over the subject vertices of all types
+        """
+        for _type in self.types:
+            for vertex_id in self.subjects[_type]:
+                yield self.label_of(vertex_id)
+
+    def pool_size(self, _type, valid=False):
+        """
+            Return the number of vertices of a type, or of valid samples if valid is set
+        """
+        return len(self.valid_index[_type] if valid else self.subjects[_type])
+
+    def vertex_at(self, _type, position, valid=False):
+        """
+            Return the vertex at a position of the subject or valid sample array
+        """
+        return self.label_of((self.valid_index[_type] if valid else self.subjects[_type])[position])
+
+    def merge(self, data):
+        """
+            Merge the data of a partial graph into the graph
+        """
+        for _type, vertices in data.items():
+            for vertex1, edges in vertices.items():
+                for edge, vertices2 in edges.items():
+                    for vertex2 in vertices2:
+                        self.add_triple(_type, vertex1, edge, vertex2)
 
     def load_from_pickle(self, file):
         """
             Load graph from pickle file
         """
         with open(file, "rb") as loadfile:
-            self.data = pickle.load(loadfile)
+            self.__dict__.update(pickle.load(loadfile))
             print("Graph loaded from ", file)
 
     def save(self, file):
         """
             save data to a pickle file
         """
+        self.compact()
         with open(file,"wb") as savefile:
-            pickle.dump(self.data, savefile)
+            pickle.dump({key: value for key, value in self.__dict__.items() if key != "label"}, savefile)
             print("Graph saved to ", file)
+
+    def save_mapped(self, file):
+        """
+            Save graph in the memory-mapped binary format read by MappedGraph
+        """
+        self.compact()
+
+        encoded = [vertex.encode("utf-8") for vertex in self.vertices]
+        string_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(vertex) for vertex in encoded], out=string_offsets[1:])
+
+        sections = {
+            "string_offsets": string_offsets,
+            "string_data": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            "sorted_vertices": np.array(sorted(range(len(encoded)), key=encoded.__getitem__), dtype=np.int32),
+            "vertex_types": np.frombuffer(self.vertex_types, dtype=np.int8),
+            "vertex_rows": np.frombuffer(self.vertex_rows, dtype=np.int32)
+        }
+        adjacency = {}
+        for _type in self.types:
+            sections[f"subjects/{_type}"] = np.frombuffer(self.subjects[_type], dtype=np.int32)
+            adjacency[_type] = []
+            for predicate_id, (offsets, targets) in self.adjacency[_type].items():
+                sections[f"offsets/{_type}/{predicate_id}"] = offsets
+                sections[f"targets/{_type}/{predicate_id}"] = targets
+                adjacency[_type].append(predicate_id)
+        for _type, vertices in self.valid_index.items():
+            sections[f"valid/{_type}"] = np.asarray(vertices, dtype=np.int32)
+
+        # Lay out sections on 8 byte boundaries after the header
+        layout, position = {}, 0
+        for name, values in sections.items():
+            layout[name] = [position, values.dtype.str, len(values)]
+            position += -(-values.nbytes // 8) * 8
+
+        header = json.dumps({
+            "label": self.label,
+            "types": self.types,
+            "predicates": self.predicates,
+            "adjacency": adjacency,
+            "valid": list(self.valid_index),
+            "sections": layout
+        }).encode("utf-8")
+        header += b" " * (-(len(MAPPED_MAGIC) + 8 + len(header)) % 8)
+
+        with open(file, "wb") as savefile:
+            savefile.write(MAPPED_MAGIC)
+            savefile.write(struct.pack("<II", MAPPED_VERSION, len(header)))
+            savefile.write(header)
+            for name, values in sections.items():
+                savefile.write(values.tobytes())
+                savefile.write(b"\0" * (-values.nbytes % 8))
+            print("Graph saved to ", file)
+
+
+class MappedGraph(CSRGraph):
+    """
+        Read-only CSR graph opened from a memory-mapped binary file.
+        Pages are loaded on demand and shared between processes.
+
+        File layout (version 2):
+            - magic bytes, format version and header length
+            - JSON header with types, predicates and the section table
+            - string pool (offsets + UTF-8 data) and string IDs sorted by value
+            - per vertex type ID and row, per type subject array
+            - per (type, predicate) CSR offsets and targets
+            - per type vertex IDs that pass sample validation
+    """
+    def __repr__(self):
+        return f"MappedGraph(label={self.label})"
+
+    def open(self, file):
+        """
+            Open a graph file written by CSRGraph.save_mapped
+        """
+        with open(file, "rb") as loadfile:
+            self.buffer = mmap.mmap(loadfile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.buffer[:len(MAPPED_MAGIC)] != MAPPED_MAGIC:
+            raise ValueError(f"{file} is not a DBLP graph file")
+        version, header_length = struct.unpack_from("<II", self.buffer, len(MAPPED_MAGIC))
+        if version != MAPPED_VERSION:
+            raise ValueError(f"Unsupported graph file version {version}, expected {MAPPED_VERSION}")
+
+        start = len(MAPPED_MAGIC) + 8
+        header = json.loads(self.buffer[start:start + header_length].decode("utf-8"))
+        start += header_length
+
+        def section(name):
+            position, dtype, length = header["sections"][name]
+            return np.frombuffer(self.buffer, dtype=dtype, count=length, offset=start + position)
+
+        self.label = self.label or header["label"]
+        self.types = header["types"]
+        self.predicates = header["predicates"]
+        self.predicate_ids = {edge: i for i, edge in enumerate(self.predicates)}
+        self.string_offsets = section("string_offsets")
+        self.string_data = start + header["sections"]["string_data"][0]
+        self.sorted_vertices = section("sorted_vertices")
+        self.vertex_types = section("vertex_types")
+        self.vertex_rows = section("vertex_rows")
+        self.subjects = {_type: section(f"subjects/{_type}") for _type in self.types}
+        self.adjacency = {
+            _type: {
+                predicate_id: (section(f"offsets/{_type}/{predicate_id}"), section(f"targets/{_type}/{predicate_id}"))
+                for predicate_id in predicate_ids
+            } for _type, predicate_ids in header["adjacency"].items()
+        }
+        self.valid_index = {_type: section(f"valid/{_type}") for _type in header["valid"]}
+        print("Graph opened from ", file)
+        return self
+
+    def label_of(self, vertex_id):
+        """
+            Return the URI or literal of a vertex ID
+        """
+        start = self.string_data + int(self.string_offsets[vertex_id])
+        end = self.string_data + int(self.string_offsets[vertex_id + 1])
+        return self.buffer[start:end].decode("utf-8")
+
+    def lookup(self, vertex):
+        """
+            Return the integer ID of a vertex or None if unknown,
+            by binary search over the sorted string pool
+        """
+        key = vertex.encode("utf-8")
+        low, high = 0, len(self.sorted_vertices)
+        while low < high:
+            middle = (low + high) // 2
+            vertex_id = int(self.sorted_vertices[middle])
+            start = self.string_data + int(self.string_offsets[vertex_id])
+            value = self.buffer[start:self.string_data + int(self.string_offsets[vertex_id + 1])]
+            if value == key:
+                return vertex_id
+            if value < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def add_triple(self, _type, vertex1, edge, vertex2):
+        """
+            Refuse to add a triple, since the mapped file cannot grow
+        """
+        raise TypeError("MappedGraph is read-only, build a CSRGraph instead")
+
+
+STORAGE_ENGINES = {
+    "dict": Graph,
+    "csr": CSRGraph,
+    "mmap": MappedGraph
+}
@@ -0,0 +1,341 @@
+"""
+    Per-template query executors compiled once from the template SPARQL,
+    so a filled template is answered from the graph without parsing it
+"""
+import re
+import logging
+
+from templates import templates
+from sparql import LocalServer, INVERSE_PREDICATES, parse, same_term, is_uri
+from client import SPARQLError
+
+logging.basicConfig(level=logging.INFO)
+
+# Slot placeholders of the query templates and how fill_slots writes their values
+SLOT = re.compile(r"\?[pc][12]\b|\?b\b|\[[A-Z_]+\]")
+
+
+def slot_name(placeholder):
+    return placeholder.strip("?[]")
+
+
+def literal_pattern(text):
+    """
+        Regex matching template text, allowing any run of whitespace where it has some
+    """
+    return r"\s+".join(re.escape(part) for part in re.split(r"\s+", text))
+
+
+def slot_pattern(placeholder):
+    """
+        Regex group capturing a slot value in a filled query
+    """
+    name = slot_name(placeholder)
+    if placeholder.startswith("?"):
+        return f"(?P<{name}><[^<>\\s]*>)"
+    if placeholder == "[DURATION]":
+        return f"(?P<{name}>\\d+)"
+    # Values with quotes or escapes are left to the server, which may not parse them
+    return f"'(?P<{name}>[^'\\\\]*)'"
+
+
+def slot_backreference(placeholder):
+    """
+        Regex matching a repeated slot, written the same way as its first occurrence
+    """
+    name = slot_name(placeholder)
+    if placeholder.startswith("?") or placeholder == "[DURATION]":
+        return f"(?P={name})"
+    return f"'(?P={name})'"
+
+
+def slot_term(placeholder, value):
+    """
+        Graph term of a captured slot value
+    """
+    if placeholder.startswith("?"):
+        return value
+    if placeholder == "[DURATION]":
+        return int(value)
+    return '"' + value + '"'
+
+
+def substitute(node, parameters):
+    """
+        Replace parameter variables in a parsed query with their terms
+    """
+    if isinstance(node, tuple):
+        if len(node) == 2 and node[0] == "var" and node[1] in parameters:
+            return ("term", parameters[node[1]])
+        return tuple(substitute(part, parameters) for part in node)
+    if isinstance(node, list):
+        return [substitute(part, parameters) for part in node]
+    if isinstance(node, dict):
+        return {key: substitute(value, parameters) for key, value in node.items()}
+    return node
+
+
+class JoinPlan:
+    """
+        Triple patterns of a template joined in the order the local server
+        would choose with its slots bound, each a direct lookup of the objects
+        of a bound subject, or of the subjects of a bound object through the
+        inverse predicate. Solutions are lists indexed by variable position
+    """
+    def __init__(self, triples, slots):
+        self.variables = list(slots)
+        self.slots = len(self.variables)
+        self.steps = []
+        position = lambda term: (
+            ("var", self.variables.index(term[1])) if term[0] == "var" else term)
+
+        bound = set(slots)
+        remaining = list(triples)
+        while remaining:
+            triple = min(remaining, key=lambda triple: LocalServer.cost(triple, bound))
+            remaining.remove(triple)
+            _, subject, predicate, _object = triple
+            if predicate[0] != "term":
+                raise ValueError(f"variable predicate in {triple}")
+            cost = LocalServer.cost(triple, bound)
+            if cost > 1:
+                raise ValueError(f"{triple} needs a scan of the graph")
+            for term in (subject, _object):
+                if term[0] == "var" and term[1] not in self.variables:
+                    self.variables.append(term[1])
+            if cost == 0:
+                source, target, lookup = subject, _object, predicate[1]
+            else:
+                source, target, lookup = _object, subject, INVERSE_PREDICATES[predicate[1]]
+            binds = target[0] == "var" and target[1] not in bound
+            self.steps.append((cost == 1, lookup, position(source), position(target), binds))
+            bound |= {term[1] for term in (subject, _object) if term[0] == "var"}
+
+    def __repr__(self):
+        return f"JoinPlan(variables={self.variables}, steps={len(self.steps)})"
+
+    def run(self, graph, parameters):
+        """
+            Return the solutions of the triple patterns as dicts of the non-slot
+            variables, or None if a slot value has to be looked up by a scan
+        """
+        solutions = [[parameters[name] for name in self.variables[:self.slots]] +
+            [None] * (len(self.variables) - self.slots)]
+        for inverse, predicate, source, target, binds in self.steps:
+            extended = []
+            for solution in solutions:
+                value = solution[source[1]] if source[0] == "var" else source[1]
+                if not is_uri(value):
+                    if inverse:
+                        return None # The server scans every vertex for the subjects of a literal
+                    continue
+                terms = graph.objects("Publication", value, predicate)
+                if binds:
+                    for term in terms:
+                        result = list(solution)
+                        result[target[1]] = term
+                        extended.append(result)
+                    continue
+                expected = solution[target[1]] if target[0] == "var" else target[1]
+                extended.extend(solution for term in terms if same_term(expected, term))
+            solutions = extended
+            if not solutions:
+                break
+        names = self.variables[self.slots:]
+        return [dict(zip(names, solution[self.slots:])) for solution in solutions]
+
+
+class CompiledTemplate:
+    """
+        A template query parsed once with its slots as parameters.
+        Single pattern queries are answered by a direct index lookup and
+        basic graph patterns by a join plan of direct lookups; anything
+        else is answered by the backend
+    """
+    def __init__(self, template):
+        self.id = template["id"]
+        sparql = template["query"]["sparql"]
+
+        self.placeholders = {}
+        pattern, position = [], 0
+        for match in SLOT.finditer(sparql):
+            pattern.append(literal_pattern(sparql[position:match.start()]))
+            placeholder = match.group()
+            name = slot_name(placeholder)
+            pattern.append(slot_backreference(placeholder) if name in self.placeholders else slot_pattern(placeholder))
+            self.placeholders[name] = placeholder
+            position = match.end()
+        pattern.append(literal_pattern(sparql[position:]))
+        self.pattern = re.compile("".join(pattern))
+
+        self.parsed = parse(SLOT.sub(lambda match: "?" + slot_name(match.group()), sparql))
+        self.lookup = self.__compile_lookup()
+        self.plan = self.__compile_plan() if self.lookup is None else None
+
+    def __repr__(self):
+        return f"CompiledTemplate(id={self.id}, slots={list(self.placeholders)}, lookup={self.lookup is not None}, plan={self.plan})"
+
+    def __compile_plan(self):
+        """
+            Return the join plan of the query's triple patterns if it has only
+            triple patterns, filters and binds after the last triple pattern,
+            and every pattern can be looked up from a bound term, else None
+        """
+        where = self.parsed["where"]
+        kinds = [element[0] for element in where]
+        if "triple" not in kinds or not set(kinds) <= {"triple", "filter", "bind"}:
+            return None
+        if "bind" in kinds and kinds.index("bind") < len(kinds) - kinds[::-1].index("triple"):
+            return None
+        try:
+            return JoinPlan([element for element in where if element[0] == "triple"], self.placeholders)
+        except ValueError as error:
+            logging.debug(f" {self.id} is answered by the backend: {error}")
+            return None
+
+    def __compile_lookup(self):
+        """
+            Return (subject, predicate, object) if the query is a single triple
+            pattern with a slot as subject or object, else None
+        """
+        where = self.parsed["where"]
+        if len(where) != 1 or where[0][0] != "triple":
+            return None
+        _, subject, predicate, _object = where[0]
+        is_slot = lambda term: term[0] == "var" and term[1] in self.placeholders
+        if predicate[0] != "term" or not (is_slot(subject) or is_slot(_object)):
+            return None
+
+        if self.parsed["form"] == "ASK":
+            return (subject, predicate, _object) if is_slot(subject) else None
+        if self.parsed["group_by"] or self.parsed["order_by"] or self.parsed["limit"] is not None or self.parsed["offset"]:
+            return None
+        if len(self.parsed["projection"]) != 1 or self.parsed["projection"][0][1] is not None:
+            return None
+        answer = self.parsed["projection"][0][0]
+        if is_slot(subject) and _object == ("var", answer):
+            return subject, predicate, _object
+        if is_slot(_object) and subject == ("var", answer) and predicate[1] in INVERSE_PREDICATES:
+            return subject, predicate, _object
+        return None
+
+    def bind(self, query):
+        """
+            Return the slot terms of a filled query, or None if it does not match the template
+        """
+        match = self.pattern.fullmatch(query)
+        if not match:
+            return None
+        return {name: slot_term(placeholder, match.group(name)) for name, placeholder in self.placeholders.items()}
+
+    def execute(self, engine, parameters):
+        """
+            Answer the template for the given slot terms, or return None
+            if it has to be answered by the backend
+        """
+        if self.lookup is None:
+            solutions = self.plan.run(engine.graph, parameters) if self.plan is not None else None
+            if solutions is None:
+                return None
+            query = substitute(self.parsed, parameters)
+            # Binds and filters follow the triple patterns, so they apply to the joined solutions
+            rest = [element for element in query["where"] if element[0] != "triple"]
+            if query["form"] == "ASK":
+                return {"head": {"link": []}, "boolean": bool(engine.evaluate_group(rest, solutions, limit=1))}
+            return engine.results(query, *engine.project(query, engine.evaluate_group(rest, solutions)))
+
+        subject, predicate, _object = self.lookup
+        if subject[0] == "var" and subject[1] in parameters:
+            terms = engine.graph.objects("Publication", parameters[subject[1]], predicate[1])
+            if self.parsed["form"] == "ASK":
+                value = parameters.get(_object[1]) if _object[0] == "var" else _object[1]
+                found = any(same_term(term, value) for term in terms) if value is not None else bool(terms)
+                return {"head": {"link": []}, "boolean": found}
+        else:
+            terms = engine.graph.objects("Publication", parameters[_object[1]], INVERSE_PREDICATES[predicate[1]])
+
+        rows = [(term,) for term in terms]
+        if self.parsed["distinct"]:
+            rows = list(dict.fromkeys(rows))
+        return engine.results(self.parsed, [self.parsed["projection"][0][0]], rows)
+
+
+class TemplateExecutor:
+    """
+        Compiled executors of the templates keyed by template id
+    """
+    def __init__(self, graph):
+        self.engine = LocalServer(graph)
+        self.compiled = {}
+        self.hits = 0
+        self.misses = 0
+        for entity_type in templates.values():
+            for query_type in entity_type.values():
+                for template in query_type:
+                    try:
+                        compiled = CompiledTemplate(template)
+                    except SyntaxError as error:
+                        logging.warning(f" Could not compile {template['id']}: {error}")
+                        continue
+                    # Templates with unions or subqueries are left to the backend
+                    if compiled.lookup is not None or compiled.plan is not None:
+                        self.compiled[template["id"]] = compiled
+        total = sum(len(query_type) for entity_type in templates.values() for query_type in entity_type.values())
+        lookups = sum(compiled.lookup is not None for compiled in self.compiled.values())
+        logging.info(
+            f" Compiled {len(self.compiled)} of {total} template executors: {lookups} single lookups, "
+            f"{len(self.compiled) - lookups} join plans, {total - len(self.compiled)} answered by the backend")
+
+    def __repr__(self):
+        return f"TemplateExecutor(templates={len(self.compiled)})"
+
+    def query(self, template_id, query):
+        """
+            Answer a filled template, or return None if it has no compiled
+            executor, the query does not match it or needs the backend
+        """
+        compiled = self.compiled.get(template_id)
+        parameters = compiled.bind(query) if compiled else None
+        answers = compiled.execute(self.engine, parameters) if parameters is not None else None
+        if answers is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return answers
+
+
+def normalize(result):
+    """
+        Comparable form of a query result: the boolean of an ASK query
+        or the sorted binding values of a SELECT query
+    """
+    if not result:
+        return []
+    if "boolean" in result:
+        return result["boolean"]
+    return sorted(
+        tuple(sorted((variable, value["value"]) for variable, value in row.items()))
+        for row in result["results"]["bindings"])
+
+
+def check_consistency(executor, server, queries):
+    """
+        Compare compiled results with the server's SPARQL results
+        for (template id, query) pairs and return the mismatches
+    """
+    checked, mismatches = 0, []
+    for template_id, query in queries:
+        compiled = executor.query(template_id, query)
+        if compiled is None:
+            continue
+        try:
+            expected = server.query(query)
+        except SPARQLError as error:
+            logging.warning(f" {error}")
+            continue
+        checked += 1
+        if normalize(compiled) != normalize(expected):
+            mismatches.append((template_id, query, compiled, expected))
+            logging.warning(f" {template_id} compiled result differs from SPARQL: {query}")
+    logging.info(f" Checked {checked} compiled queries, {len(mismatches)} mismatches")
+    return mismatches
@@ -0,0 +1,109 @@
+"""
+    Keyword candidates of publication titles, extracted in bulk with spaCy
+    and stored in a sidecar index next to the graph
+"""
+import hashlib
+import logging
+
+import numpy as np
+from tqdm import tqdm
+
+logging.basicConfig(level=logging.INFO)
+
+# Pipeline components the noun phrase pattern needs, the others are disabled
+KEYWORD_COMPONENTS = ("tok2vec", "tagger", "morphologizer", "attribute_ruler")
+NOUN_PHRASE = [{"POS": "NOUN"}, {"POS": "NOUN", "OP": "*"}, {"POS": "NOUN"}]
+
+
+def keyword_matcher(nlp):
+    from spacy.matcher import Matcher
+    matcher = Matcher(nlp.vocab)
+    matcher.add("NOUN_PHRASE", [NOUN_PHRASE])
+    return matcher
+
+
+def extract_keywords(doc, matcher):
+    """
+        Return the noun phrases of a parsed title that are not stop words
+    """
+    keywords = [doc[start:end].text for _, start, end in matcher(doc)]
+    return [keyword for keyword in keywords if not doc.vocab[keyword].is_stop]
+
+
+def title_key(title):
+    """
+        64 bit hash of a title as the keyword extraction sees it
+    """
+    return int.from_bytes(hashlib.blake2b(title.lower().encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class KeywordIndex:
+    """
+        Keyword candidates of titles keyed by the hash of the lowercased title.
+        Keywords are interned in a vocabulary, and the candidates of the sorted
+        keys are stored as offsets into one array of keyword ids
+    """
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.ids = np.zeros(0, dtype=np.int32)
+        self.vocabulary = []
+
+    def __repr__(self):
+        return f"KeywordIndex(titles={len(self.keys)}, keywords={len(self.vocabulary)})"
+
+    def __len__(self):
+        return len(self.keys)
+
+    def build(self, titles, nlp, workers=1, batch_size=1000):
+        """
+            Extract the keywords of the titles with nlp.pipe in workers processes
+        """
+        titles = list(dict.fromkeys(title.lower() for title in titles))
+        disable = [name for name in nlp.pipe_names if name not in KEYWORD_COMPONENTS]
+        matcher = keyword_matcher(nlp)
+        docs = nlp.pipe(titles, batch_size=batch_size, disable=disable, n_process=max(1, workers))
+        candidates = {}
+        for title, doc in tqdm(zip(titles, docs), total=len(titles), desc="Extracting keywords: "):
+            candidates[title_key(title)] = extract_keywords(doc, matcher)
+
+        vocabulary = {}
+        self.keys = np.array(sorted(candidates), dtype=np.uint64)
+        ids = [[vocabulary.setdefault(keyword, len(vocabulary)) for keyword in candidates[int(key)]] for key in self.keys]
+        self.offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum([len(each) for each in ids])
+        self.ids = np.fromiter((id for each in ids for id in each), dtype=np.int32, count=int(self.offsets[-1]))
+        self.vocabulary = list(vocabulary)
+        logging.info(f" Extracted {len(self.vocabulary)} keywords from {len(self.keys)} titles")
+        return self
+
+    def get(self, title):
+        """
+            Return the keyword candidates of a title, or None if it is not indexed
+        """
+        key = np.uint64(title_key(title))
+        position = int(np.searchsorted(self.keys, key))
+        if position == len(self.keys) or self.keys[position] != key:
+            return None
+        return [self.vocabulary[id] for id in self.ids[self.offsets[position]:self.offsets[position + 1]]]
+
+    def save(self, file):
+        """
+            Save the index to a NumPy archive
+        """
+        vocabulary = np.frombuffer("\n".join(self.vocabulary).encode("utf-8"), dtype=np.uint8)
+        np.savez_compressed(file, keys=self.keys, offsets=self.offsets, ids=self.ids, vocabulary=vocabulary)
+        logging.info(f" Keyword index saved to {file}")
+
+    def load(self, file):
+        """
+            Load the index from a NumPy archive
+        """
+        with np.load(file) as archive:
+            self.keys = archive["keys"]
+            self.offsets = archive["offsets"]
+            self.ids = archive["ids"]
+            vocabulary = archive["vocabulary"].tobytes().decode("utf-8")
+        self.vocabulary = vocabulary.split("\n") if vocabulary else []
+        logging.info(f" Keyword index loaded from {file}")
+        return self
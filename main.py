@@ -3,8 +3,13 @@ import logging
 
 from models import DataGenerator, ParaphrasePairGenerator
 from utils import save_to_json, save_paraphrases_json
-from utils import plot_question_distributions, plot_template_distribution, compute_data_distribution
-from utils import index_graph, load_graph
+from utils import compute_data_distribution
+from utils import index_graph, load_graph, load_template_index, load_keyword_index
+from utils import query_client, generate_sharded, output_files, convert_outputs
+from utils import checkpoint_file
+from executors import check_consistency
+from pipeline import Writer
+from checkpoint import Checkpoint
 
 
 logging.basicConfig(level=logging.INFO)
@@ -16,10 +21,36 @@ if __name__ == "__main__":
     
     parser.add_argument("--index", action="store_true", help="Index the graph")
     parser.add_argument("--graph_path", type=str, default="data/dblp.nt", help="Path to the graph")
+    parser.add_argument("--storage", type=str, default="mmap", choices=["dict", "csr", "mmap"], help="Graph storage engine")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes for indexing and generation")
 
     parser.add_argument("--generate", action="store_true", help="Generate data")
     parser.add_argument("--size", type=int, default=10000, help="Number of questions to generate")
     parser.add_argument("--seed", type=int, default=2358, help="Random seed")
+    parser.add_argument("--backend", type=str, default="server", choices=["server", "local"], help="Answer queries with the DBLP server or the local graph")
+    parser.add_argument("--fill_workers", type=int, default=1, help="Number of threads filling templates during generation")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of queries in flight during generation")
+    parser.add_argument("--batch_size", type=int, default=1, help="Number of queries of a template sent in one VALUES batch")
+    parser.add_argument("--queue_size", type=int, default=1024, help="Number of generated questions waiting to be written")
+    parser.add_argument("--compiled", action="store_true", help="Answer templates with compiled executors over the local graph where possible")
+    parser.add_argument("--cache", type=str, default="dblp.cache.sqlite", help="Query result cache, empty to disable")
+    parser.add_argument("--cache_size", type=int, default=1024, help="Maximum size of the query result cache in MB")
+    parser.add_argument("--cache_ttl", type=float, default=None, help="Expire cached query results after this many seconds")
+    parser.add_argument("--timeout", type=float, default=60, help="Read timeout of SPARQL requests in seconds")
+    parser.add_argument("--retries", type=int, default=5, help="Retries of failed SPARQL requests")
+    parser.add_argument("--rate", type=float, default=None, help="Maximum SPARQL requests per second")
+    parser.add_argument("--bucket_attempts", type=int, default=None, help="Give up a bucket of questions after this many attempts")
+    parser.add_argument("--bucket_time", type=float, default=None, help="Give up a bucket of questions after this many seconds")
+    parser.add_argument("--lookahead", type=int, default=256, help="Number of question slots past the last written one that can be attempted")
+    parser.add_argument("--sample_reuse", type=int, default=1, help="Share each sample pair between the templates of this many buckets")
+    parser.add_argument("--checkpoint_every", type=int, default=1000, help="Save a checkpoint every this many questions, 0 to disable")
+    parser.add_argument("--resume", action="store_true", help="Resume generation from the last checkpoint")
+    parser.add_argument("--check_compiled", type=int, default=0, help="Compare compiled results with the backend on this many samples per template")
+
+    parser.add_argument("--output_format", type=str, default="json", choices=["json", "jsonl"], help="Write questions as json files or JSON Lines shards")
+    parser.add_argument("--compression", type=str, default=None, choices=["gzip", "zstd"], help="Compression of JSON Lines shards")
+    parser.add_argument("--shard_size", type=int, default=0, help="Start a new JSON Lines shard after this many MB, 0 for one shard")
+    parser.add_argument("--convert", action="store_true", help="Convert JSON Lines output to json files")
 
     parser.add_argument("--generate_paraphrases", action="store_true", help="Generate paraphrases")
 
@@ -27,29 +58,66 @@ if __name__ == "__main__":
     
     args = parser.parse_args()
 
+    if args.resume and args.workers > 1:
+        parser.error("--resume is only supported with --workers 1")
+
     if args.index:
-        index_graph(args.graph_path)
+        index_graph(args.graph_path, args.storage, args.workers)
     
     if args.generate:
 
-        graph = load_graph()
-        dataGenerator = DataGenerator(graph, args.seed)
-        
         data_size = {
             "train": int(args.size * 0.7),
             "valid": int(args.size * 0.1),
             "test": int(args.size * 0.2)
         }
-        
-        for group, size in data_size.items():
-            logging.info(f"Generating {size} {group} questions")
-            generator = dataGenerator.generate(group, size)
-            save_to_json(group+"_questions.json", group+"_answers.json", "failed_queries.json", generator)
+
+        if args.workers > 1:
+            logging.info(f"Generating {args.size} questions in {args.workers} shards")
+            generate_sharded(args, data_size)
+        else:
+            cache, client = query_client(args)
+            graph = load_graph(args.storage)
+            dataGenerator = DataGenerator(
+                graph, args.seed, load_template_index(graph), args.backend, args.compiled, cache, client, load_keyword_index())
+
+            for group, size in data_size.items():
+                checkpoint = Checkpoint(
+                    checkpoint_file(group), dataGenerator.entity_types, dataGenerator.query_types, args.checkpoint_every,
+                    seed=args.seed, size=size, output_format=args.output_format, compression=args.compression,
+                    sample_reuse=args.sample_reuse, bucket_attempts=args.bucket_attempts, bucket_time=args.bucket_time)
+                resume = None
+                if args.resume and checkpoint.load():
+                    if checkpoint.state["done"]:
+                        logging.info(f"Skipping {group} questions, they are complete")
+                        continue
+                    resume = checkpoint.resume_state()
+                logging.info(f"Generating {size} {group} questions")
+                generator = dataGenerator.generate(
+                    group, size, args.concurrency, args.batch_size, fill_workers=args.fill_workers, resume=resume,
+                    bucket_attempts=args.bucket_attempts, bucket_time=args.bucket_time, sample_reuse=args.sample_reuse,
+                    lookahead=args.lookahead, abandon=checkpoint.abandon)
+                writer = Writer(
+                    lambda items: save_to_json(
+                        *output_files(group, args.output_format), items,
+                        args.output_format, args.compression, args.shard_size * 1024 ** 2 or None, checkpoint),
+                    args.queue_size)
+                writer.write(generator)
+                writer.report()
     
+    if args.convert:
+        convert_outputs(["train", "valid", "test"])
+
+    if args.check_compiled:
+        cache, client = query_client(args)
+        graph = load_graph(args.storage)
+        dataGenerator = DataGenerator(graph, args.seed, load_template_index(graph), args.backend, compiled=True, cache=cache, client=client)
+        check_consistency(dataGenerator.executor, dataGenerator.server, dataGenerator.sample_queries(args.check_compiled))
+
     if args.generate_paraphrases:
         logging.info("Generating paraphrases")
-        graph = load_graph()
-        paraphraseGenerator = ParaphrasePairGenerator(graph, args.seed)
+        graph = load_graph(args.storage)
+        paraphraseGenerator = ParaphrasePairGenerator(graph, args.seed, load_template_index(graph), load_keyword_index())
         generator = paraphraseGenerator.generate()
         save_paraphrases_json("paraphrase_pairs.json", generator=generator)
 
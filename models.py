@@ -3,32 +3,115 @@
 """
 import re
 import json
+import math
+import heapq
 import random
+import hashlib
+import queue
 import logging
+import threading
 
-import requests
 import urllib.parse
-from itertools import combinations
-
-import spacy
-from spacy.matcher import Matcher
-
-nlp = spacy.load("en_core_web_sm")
+from itertools import combinations, count
+from collections import OrderedDict
+from contextlib import closing
 
 from templates import templates
+from sparql import LocalServer
+from executors import TemplateExecutor
+from client import SPARQLClient, SPARQLError, permanent_error
+from batching import QueryBatcher
+from pipeline import Stage
+from scheduler import QuotaScheduler
+from keywords import keyword_matcher, extract_keywords
 
 logging.basicConfig(level=logging.INFO)
 
-with open("data/CORE.json", "r") as f:
-    CORE = json.load(f)
+# The spaCy pipeline and the CORE venue names are loaded on first use
+_resources = {}
+_resources_lock = threading.Lock()
+
+
+def load_nlp():
+    """
+        Return the spaCy pipeline, loading it on first use
+    """
+    with _resources_lock:
+        if "nlp" not in _resources:
+            import spacy
+            _resources["nlp"] = spacy.load("en_core_web_sm")
+        return _resources["nlp"]
+
+
+def load_core():
+    """
+        Return the CORE venue names, reading them on first use
+    """
+    with _resources_lock:
+        if "core" not in _resources:
+            with open("data/CORE.json", "r") as f:
+                _resources["core"] = json.load(f)
+        return _resources["core"]
+
+
+# Sample pairs kept for reuse by the candidates of other buckets
+SHARED_PAIRS = 4096
+
+ENTITY_TYPES = ["CREATOR", "PUBLICATION"]
+QUERY_TYPES = [
+    "SINGLE_FACT","MULTI_FACT","DOUBLE_INTENT",
+    "BOOLEAN","NEGATION","DOUBLE_NEGATION",
+    "UNION","DISAMBIGUATION",
+    "COUNT","SUPERLATIVE+COMPARATIVE"
+]
+
+# Entity type of every template by template id
+TEMPLATE_ENTITY_TYPES = {
+    template["id"]: entity_type for entity_type in templates
+    for query_type in templates[entity_type] for template in templates[entity_type][query_type]}
+
+def join_slots(parts, values):
+    """
+        Join text split by TemplateStrings with the values of its placeholders
+    """
+    filled = parts.copy()
+    filled[1::2] = [str(values[placeholder]) for placeholder in parts[1::2]]
+    return "".join(filled)
+
+
+class TemplateStrings:
+    """
+        Question strings and query of a template split once into literal
+        text at even positions and slot placeholders at odd positions
+    """
+    def __init__(self, template, placeholders):
+        pattern = re.compile("(" + "|".join(re.escape(each) for each in sorted(placeholders, key=len, reverse=True)) + ")")
+        self.id = template["id"]
+        self.questions = [pattern.split(string) for string in template["question"]["strings"]]
+        self.query = pattern.split(template["query"]["sparql"])
+        self.pairs = list(combinations(range(len(self.questions)), 2))
+
+        # Placeholders every question string uses, so that both the question and the paraphrase have them
+        self.required = set.intersection(*(set(question[1::2]) for question in self.questions))
+
+        # Positions of the pair strings each placeholder appears in, first and second of each pair
+        self.pair_uses = {}
+        for index, (first, second) in enumerate(self.pairs):
+            for position, question in ((2 * index, first), (2 * index + 1, second)):
+                for placeholder in set(self.questions[question][1::2]):
+                    self.pair_uses.setdefault(placeholder, []).append(position)
+
+    def __repr__(self):
+        return f"TemplateStrings(id={self.id}, questions={len(self.questions)})"
+
 
 class Sample:
     """
         Wrapper for the sample sub-graph sampled from the graph
     """
     def __init__(self, data):
-        self.data = data[next(iter(data))]
-        self.uri = next(iter(data))
+        self.data = data
+        self.uri = data.vertex
         self.title = self.__get_title()
         self.bibtextype = self.__get_bibtextype()
         self.authors = self.__get_authors()
@@ -49,12 +132,12 @@ class Sample:
         return self.data.get(self.dblp_prefix("bibtexType"),[""])[0].replace('"',"")
 
     def __get_authors(self):
-        authors = self.data.get(self.dblp_prefix("authoredBy"), [])
+        authors = self.data.neighbours(self.dblp_prefix("authoredBy"))
         return [
             {
-                "uri": next(iter(author)),
-                "name": author[next(iter(author))].get(self.dblp_prefix("primaryFullCreatorName"), ["NONE"])[0].replace('"',""),
-                "affiliation": author[next(iter(author))].get(self.dblp_prefix("primaryAffiliation"), ["NONE"])[0].replace('"',"")
+                "uri": author.vertex,
+                "name": author.get(self.dblp_prefix("primaryFullCreatorName"), ["NONE"])[0].replace('"',""),
+                "affiliation": author.get(self.dblp_prefix("primaryAffiliation"), ["NONE"])[0].replace('"',"")
             } for author in authors] if authors else None
 
     def __get_year(self):
@@ -70,35 +153,103 @@ class SampleGenerator:
     """
     def __init__(self, graph):
         self.graph = graph
+        self.attempts = 0
+        self.accepted = 0
     
-    def get(self, type, count=1):
+    def get(self, type, count=1, pool=None, rng=random):
         """
             Return a valid sample from the graph
         """
-        sample = Sample(self.graph.sample_vertex(type, count))
-        if sample.validate:
-            return sample
-        return self.get(type, count)
+        if count > 1:
+            return self.get_batch(type, count, pool, rng)
+        return self.get_batch(type, 1, pool, rng)[0]
+
+    def get_batch(self, type, count, pool=None, rng=random):
+        """
+            Return a list of count valid samples from the graph,
+            drawing vertices in batches without replacement.
+            Samples come from the graph's valid sample index if it has one,
+            restricted to the positions in pool if given
+        """
+        valid = len(self.graph.valid_index.get(type, [])) > 0
+        samples = []
+        while len(samples) < count:
+            for vertex in self.graph.random_vertices(type, count - len(samples), valid=valid, pool=pool, rng=rng):
+                sample = Sample(self.graph.subgraph(type, vertex))
+                self.attempts += 1
+                if sample.validate:
+                    self.accepted += 1
+                    samples.append(sample)
+        return samples
+
+    def get_at(self, type, rng=random):
+        """
+            Return a valid sample from the graph with its position in the
+            graph's valid sample index, or vertex index if it has none
+        """
+        valid = len(self.graph.valid_index.get(type, [])) > 0
+        while True:
+            position = rng.randrange(self.graph.pool_size(type, valid))
+            sample = Sample(self.graph.subgraph(type, self.graph.vertex_at(type, position, valid)))
+            self.attempts += 1
+            if sample.validate:
+                self.accepted += 1
+                return position, sample
+
+    def acceptance_rate(self):
+        """
+            Return the fraction of sampled vertices that passed validation
+        """
+        return self.accepted / self.attempts if self.attempts else 0.0
 
 
 class DBLPServer:
     """
         DBLP Server class
     """
-    def __init__(self, path):
+    def __init__(self, path, cache=None, client=None):
         with open(path, "r", encoding="utf-8") as f:
             self.host = json.load(f)["host"]
         self.result_format = "json"
+        self.cache = cache
+        self.client = client or SPARQLClient()
     
     def query(self, query):
         """
-            Query the DBLP server
+            Query the DBLP server, or the result cache if the query was answered before.
+            Raise SPARQLError if the server gave no response, after retries
         """
-        url = f"{self.host}/sparql?query={urllib.parse.quote(query)}&format=application%2Fsparql-results%2B{self.result_format}"
-        response = requests.get(url)
-        if response.status_code == 200:
+        result = self.fetch(query)
+        if result is None:
+            raise SPARQLError(f"No response from {self.host} for query: {query}")
+        return self.answers(result)
+
+    def fetch(self, query, cached=True):
+        """
+            Return the server's result for a query, an empty result if the server
+            rejected the query, or None if it gave no response after retrying
+            connection errors, throttling and server errors.
+            The cache is bypassed if cached is False
+        """
+        result = self.cache.get(query) if self.cache is not None and cached else None
+        if result is None:
+            url = f"{self.host}/sparql?query={urllib.parse.quote(query)}&format=application%2Fsparql-results%2B{self.result_format}"
+            response = self.client.get(url)
+            if permanent_error(response):
+                logging.debug(f" Query rejected with status {response.status_code}: {query}")
+                return {}
+            if response is None or response.status_code != 200:
+                return None
             result = json.loads(response.text)
+            if self.cache is not None and cached:
+                self.cache.put(query, result)
+        return result
 
+    def answers(self, result):
+        """
+            Return the result if it holds answers, else []
+        """
+        if result:
             if "boolean" in result.keys():
                 return result
             elif "results" in result.keys():
@@ -108,41 +259,48 @@ class DBLPServer:
 
 class KeywordGenerator:
     """
-        Keyword generator from the title
+        Keyword generator from the title, looking up the keyword index if
+        it has the title and extracting the keywords with spacy otherwise
     """
-    def __init__(self):
-        pass
+    def __init__(self, index=None):
+        self.index = index
+        self.matcher = None
+        self.lookups = 0
+        self.extracted = 0
     
-    def get(self, title):
+    def get(self, title, rng=random):
         """
-            Extract main keywords from the title using spacy
+            Return a random main keyword of the title
         """
-        doc = nlp(title.lower())
-        matcher = Matcher(nlp.vocab)
-        
-        pattern = [{"POS": "NOUN"}, {"POS": "NOUN", "OP": "*"}, {"POS": "NOUN"}]
-        matcher.add("NOUN_PHRASE", [pattern])
-        matches = matcher(doc)
-        
-        keywords = [doc[start:end].text for _, start, end in matches]
-        keywords = [keyword for keyword in keywords if not nlp.vocab[keyword].is_stop]
-        return random.choice(keywords).capitalize() if keywords else "NONE"
+        keywords = self.index.get(title) if self.index is not None else None
+        if keywords is None:
+            self.extracted += 1
+            nlp = load_nlp()
+            if self.matcher is None:
+                self.matcher = keyword_matcher(nlp)
+            keywords = extract_keywords(nlp(title.lower()), self.matcher)
+        else:
+            self.lookups += 1
+        return rng.choice(keywords).capitalize() if keywords else "NONE"
 
 class ParaphrasePairGenerator:
     """
         Generate paraphrase pairs
     """
-    def __init__(self, graph, seed):
-        self.datagenerator = DataGenerator(graph, seed)
+    def __init__(self, graph, seed, template_index=None, keyword_index=None):
+        self.datagenerator = DataGenerator(graph, seed, template_index, keyword_index=keyword_index)
     
     def instantiate(self, template):
-        first_sample = self.datagenerator.sample_generator.get("Publication")
-        second_sample = self.datagenerator.sample_generator.get("Publication")
-        _, _, _, _, paraphrase_pairs = self.datagenerator.fill_slots(template, first_sample, second_sample, group="test")
-        paraphrase_pair = random.choice(paraphrase_pairs)
-        if "NONE" in paraphrase_pair[0] or "NONE" in paraphrase_pair[1]:
-            return self.instantiate(template)
-        return paraphrase_pairs
+        while True:
+            first_sample = self.datagenerator.sample_generator.get("Publication", pool=self.datagenerator.template_pool(template))
+            second_sample = self.datagenerator.sample_generator.get("Publication")
+            slots = self.datagenerator.slot_values(first_sample, second_sample)
+            if self.datagenerator.preflight(template, slots):
+                continue
+            _, _, _, _, paraphrase_pairs = self.datagenerator.fill_slots(template, first_sample, second_sample, group="test", slots=slots)
+            paraphrase_pair = random.choice(paraphrase_pairs)
+            if "NONE" not in paraphrase_pair[0] and "NONE" not in paraphrase_pair[1]:
+                return paraphrase_pairs
 
     def generate(self):
         for entity_type in self.datagenerator.entity_types:
@@ -154,20 +312,81 @@ class DataGenerator:
     """
         Generate question-query pairs
     """
-    def __init__(self, graph, seed):
+    def __init__(self, graph, seed, template_index=None, backend="server", compiled=False, cache=None, client=None,
+                 keyword_index=None):
         random.seed(seed)
-        self.entity_types = ["CREATOR", "PUBLICATION"]
-        self.query_types = [
-            "SINGLE_FACT","MULTI_FACT","DOUBLE_INTENT",
-            "BOOLEAN","NEGATION","DOUBLE_NEGATION",
-            "UNION","DISAMBIGUATION",
-            "COUNT","SUPERLATIVE+COMPARATIVE"
-        ]
+        self.seed = seed
+        self.entity_types = list(ENTITY_TYPES)
+        self.query_types = list(QUERY_TYPES)
         self.sample_generator = SampleGenerator(graph)
-        self.server = DBLPServer("config.json")
-        self.keyword_generator = KeywordGenerator()
+        self.server = LocalServer(graph) if backend == "local" else DBLPServer("config.json", cache, client)
+        self.executor = TemplateExecutor(graph) if compiled else None
+        self.cache = cache if backend != "local" else None
+        self.client = self.server.client if backend != "local" else None
+        self.batcher = QueryBatcher(self.server) if backend != "local" else None
+        self.keyword_generator = KeywordGenerator(keyword_index)
+        self.compiled_strings = {}
+        self.template_index = template_index
+        self.rejections = {}
+        self.rejections_lock = threading.Lock()
+        self.sample_reuse = 1
+        self.shared_pairs = OrderedDict()
+        self.shared_lock = threading.Lock()
+        self.shared_draws = 0
+        self.shared_uses = 0
+
+    def template_pool(self, template):
+        """
+            Return the pool of publications meeting the template's preconditions,
+            or None to sample from all publications
+        """
+        return self.template_index.pool(template["id"]) if self.template_index else None
+
+    def execute(self, template, query):
+        """
+            Answer a filled template with its compiled executor if available,
+            otherwise with the server. Return None if the server gave no response
+        """
+        answers = self.executor.query(template["id"], query) if self.executor else None
+        if answers is not None:
+            return answers
+        try:
+            return self.server.query(query)
+        except SPARQLError as error:
+            logging.warning(f" {error}")
+            return None
+
+    def execute_batch(self, candidates):
+        """
+            Answer a batch of filled templates, sending those without a compiled
+            executor to the server in VALUES batches where it supports them
+        """
+        answers = [self.executor.query(candidate[0]["id"], candidate[3]) if self.executor else None
+            for candidate in candidates]
+        pending = [index for index, answer in enumerate(answers) if answer is None]
+        if self.batcher:
+            results = self.batcher.fetch([(candidates[index][0]["id"], candidates[index][3]) for index in pending])
+            results = [self.server.answers(result) if result is not None else None for result in results]
+        else:
+            results = [self.execute(candidates[index][0], candidates[index][3]) for index in pending]
+        for index, result in zip(pending, results):
+            answers[index] = result
+        return answers
 
-    def alt_name(self, name):
+    def sample_queries(self, count):
+        """
+            Fill every template with count random samples, yielding (template id, query)
+        """
+        for entity_type in self.entity_types:
+            for query_type in self.query_types:
+                for template in templates[entity_type][query_type]:
+                    for _ in range(count):
+                        first_sample = self.sample_generator.get("Publication", pool=self.template_pool(template))
+                        second_sample = self.sample_generator.get("Publication")
+                        _, _, query, _, _ = self.fill_slots(template, first_sample, second_sample, group="test")
+                        yield template["id"], query
+
+    def alt_name(self, name, rng=random):
         """
             Generate alternative name for the creator
         """
@@ -182,7 +401,7 @@ class DataGenerator:
             name[0] + " " + name[1][0].replace(".","") + ". " + " ".join(name[2:]), # John W. Smith
             name[-1] + ", " + name[0][0].replace(".","") + ". " + " ".join(name[1:-1]) # Smith, J. William
         ]
-        alt_name = random.choice(alt_names) + "$"
+        alt_name = rng.choice(alt_names) + "$"
         return alt_name.replace(" $","").replace("$","")
 
     def alt_duration(self, duration):
@@ -200,7 +419,7 @@ class DataGenerator:
             Generate alternative venue
         """
         venue = re.sub(r"\(.*\)", "", venue).strip()
-        return CORE.get(venue.upper().replace(".",""), venue)
+        return load_core().get(venue.upper().replace(".",""), venue)
 
     def alt_affiliation(self, affiliation):
         """
@@ -209,16 +428,16 @@ class DataGenerator:
         affiliation = affiliation.split(",")[0]
         return affiliation
 
-    def fill_slots(self, template, first_sample, second_sample, group):
+    def slot_values(self, first_sample, second_sample, rng=random):
         """
-            Fill the slots in the template with the values from the samples
+            Return the candidate values of every slot for the samples
         """
         def get_bibtextype(bibtextype):
             return bibtextype.split("#")[1].replace(">", "")
 
         if first_sample.authors:
             if len(first_sample.authors) > 1:
-                creator, other_creator = random.sample(first_sample.authors, 2)
+                creator, other_creator = rng.sample(first_sample.authors, 2)
             else:
                 creator, other_creator = first_sample.authors[0], second_sample.authors[0]
         else:
@@ -227,11 +446,11 @@ class DataGenerator:
         name = creator.get("name")
         other_name = other_creator.get("name")
         affiliation = creator.get("affiliation")
-        duration = str(random.choice(range(2, 10)))
+        duration = str(rng.choice(range(2, 10)))
         venue = first_sample.venue
         other_venue = second_sample.venue
 
-        slots = {
+        return {
             "?p1": [first_sample.uri],
             "?p2": [second_sample.uri],
             "?c1": [creator.get("uri")],
@@ -239,8 +458,8 @@ class DataGenerator:
             "?b": [first_sample.bibtextype],
             "[TITLE]": ["'"+first_sample.title+"'"],
             "[OTHER_TITLE]": ["'"+second_sample.title+"'"],
-            "[CREATOR_NAME]": [name, self.alt_name(name)],
-            "[OTHER_CREATOR_NAME]": [other_name, self.alt_name(other_name)],
+            "[CREATOR_NAME]": [name, self.alt_name(name, rng)],
+            "[OTHER_CREATOR_NAME]": [other_name, self.alt_name(other_name, rng)],
             "[TYPE]": [get_bibtextype(first_sample.bibtextype)],
             "[PARTIAL_CREATOR_NAME]": name.split(" "),
             "[AFFILIATION]": [affiliation, self.alt_affiliation(affiliation)],
@@ -248,37 +467,89 @@ class DataGenerator:
             "[DURATION]": [duration, self.alt_duration(duration)],
             "[VENUE]": [venue, self.alt_venue(venue)],
             "[OTHER_VENUE]": [other_venue, self.alt_venue(other_venue)],
-            "[KEYWORD]": [self.keyword_generator.get(first_sample.title)]
+            "[KEYWORD]": [self.keyword_generator.get(first_sample.title, rng)]
         }
 
-        question_strings = template["question"]["strings"].copy()
-        paraphrase_pairs = list(combinations(question_strings, 2))
+    def template_strings(self, template, placeholders):
+        """
+            Return the template's strings split into text and placeholders, splitting them on first use
+        """
+        strings = self.compiled_strings.get(template["id"])
+        if strings is None:
+            strings = self.compiled_strings[template["id"]] = TemplateStrings(template, placeholders)
+        return strings
+
+    def preflight(self, template, slots):
+        """
+            Return why the slot values cannot give a valid question for the template,
+            or None if they may. A slot that every question string uses makes the
+            question invalid if all of its values are NONE
+        """
+        strings = self.template_strings(template, slots)
+        for placeholder in sorted(strings.required):
+            if all("NONE" in str(value) for value in slots[placeholder]):
+                return f"{placeholder} is NONE"
+        return None
+
+    def reject(self, template, reason):
+        """
+            Count a candidate rejected before it was filled
+        """
+        with self.rejections_lock:
+            reasons = self.rejections.setdefault(template["id"], {})
+            reasons[reason] = reasons.get(reason, 0) + 1
+
+    def report_rejections(self):
+        rejected = sum(sum(reasons.values()) for reasons in self.rejections.values())
+        if not rejected:
+            return
+        logging.info(f" Rejected {rejected} candidates before filling and execution")
+        for template_id, reasons in sorted(self.rejections.items()):
+            logging.info(f"  {template_id}: " + ", ".join(f"{reason} ({count})" for reason, count in sorted(reasons.items())))
+
+    def fill_slots(self, template, first_sample, second_sample, group, rng=random, slots=None):
+        """
+            Fill the slots in the template with the values from the samples,
+            or with slots if their values have already been drawn
+        """
+        if slots is None:
+            slots = self.slot_values(first_sample, second_sample, rng)
+        strings = self.template_strings(template, slots)
+
+        question_indices = list(range(len(strings.questions)))
 
         # Withold two questions for the train set but not test set
         if group == "train":
-            question_strings.pop(1)
-            question_strings.pop(2)
+            question_indices.pop(1)
+            question_indices.pop(2)
 
         # Randomly select two questions
-        question, paraphrase = random.sample(question_strings, 2)
-        query = template["query"]["sparql"]
+        question_index, paraphrase_index = rng.sample(question_indices, 2)
 
-        # Fill in the template with the sample
+        # Draw a value per slot and string in the order of substituting the slots one at a time,
+        # keeping only the values of the strings the slot appears in
+        choose = rng.choice
+        question_values, paraphrase_values = {}, {}
+        pair_values = [{} for _ in range(2 * len(strings.pairs))]
         for placeholder, value in slots.items():
-            question, paraphrase = [
-                    each.replace(placeholder, str(random.choice(value)))
-                        for each in [question, paraphrase]
-                ]
-
-            query = query.replace(placeholder, value[0]
-                if placeholder.startswith("?") or placeholder == "[DURATION]" else "'" + str(value[0]) + "'")
-
-            paraphrase_pairs = [
-                     (each[0].replace(placeholder, "["+str(random.choice(value))+"]"),
-                        each[1].replace(placeholder, "["+str(random.choice(value))+"]"),
-                           template["id"])
-                     for each in paraphrase_pairs
-            ]
+            question_values[placeholder] = choose(value)
+            paraphrase_values[placeholder] = choose(value)
+            draws = [choose(value) for _ in pair_values]
+            for index in strings.pair_uses.get(placeholder, ()):
+                pair_values[index][placeholder] = "[" + str(draws[index]) + "]"
+        query_values = {
+            placeholder: value[0] if placeholder.startswith("?") or placeholder == "[DURATION]" else "'" + str(value[0]) + "'"
+            for placeholder, value in slots.items()}
+
+        # Fill in the template with the sample
+        question = join_slots(strings.questions[question_index], question_values)
+        paraphrase = join_slots(strings.questions[paraphrase_index], paraphrase_values)
+        query = join_slots(strings.query, query_values)
+        paraphrase_pairs = [
+            (join_slots(strings.questions[first], pair_values[2 * index]),
+                join_slots(strings.questions[second], pair_values[2 * index + 1]), template["id"])
+            for index, (first, second) in enumerate(strings.pairs)]
+
         entities = []
         
         # Save the entities
@@ -287,9 +558,172 @@ class DataGenerator:
 
         return question, paraphrase, query, entities, paraphrase_pairs
 
-    def generate(self, group, num_samples):
+    def question_rng(self, *key):
+        """
+            Random stream of a question slot, derived from the seed and the
+            slot's key alone so that it does not depend on any other slot
+        """
+        digest = hashlib.sha256(":".join(str(part) for part in (self.seed,) + key).encode()).digest()
+        return random.Random(int.from_bytes(digest[:8], "little"))
+
+    def shared_samples(self, group, entity_type, query_type, index, attempt):
         """
-            Generate question-query pairs
+            Return the sample pair that the same attempt at the same slot index shares
+            across sample_reuse consecutive buckets, as ((position, sample), sample).
+            A pair is drawn from its own random stream, so it does not matter which
+            bucket asks first, and it is dropped once every bucket has taken it
+        """
+        bucket = self.entity_types.index(entity_type) * len(self.query_types) + self.query_types.index(query_type)
+        key = (group, index, attempt, bucket // self.sample_reuse)
+        with self.shared_lock:
+            pair = self.shared_pairs.get(key)
+        if pair is None:
+            rng = self.question_rng("pair", *key)
+            pair = [self.sample_generator.get_at("Publication", rng), self.sample_generator.get("Publication", rng=rng), 0]
+        with self.shared_lock:
+            if key not in self.shared_pairs:
+                self.shared_draws += 1
+            pair = self.shared_pairs.setdefault(key, pair)
+            pair[2] += 1
+            self.shared_uses += 1
+            if pair[2] >= self.sample_reuse:
+                del self.shared_pairs[key]
+            elif len(self.shared_pairs) > SHARED_PAIRS:
+                self.shared_pairs.popitem(last=False)
+        return pair[0], pair[1]
+
+    def candidate(self, group, entity_type, query_type, index, attempt):
+        """
+            Fill a template for an attempt at a question slot, drawing only from its random stream.
+            Return None if the slot values are rejected before filling
+        """
+        rng = self.question_rng(group, entity_type, query_type, index, attempt)
+
+        # Withold test_only templates for the train set
+        selected_templates = templates[entity_type][query_type]
+        if group == "train":
+            selected_templates = [template for template in selected_templates if not template["test_only"]]
+
+        # Get a random template for entity type and query type
+        template = rng.choice(selected_templates)
+
+        # Get two random samples, the first one meeting the template's preconditions,
+        # or a pair shared with other buckets if its first sample meets them
+        if self.sample_reuse > 1:
+            (position, first_sample), second_sample = self.shared_samples(group, entity_type, query_type, index, attempt)
+            if self.template_index and not self.template_index.contains(template["id"], position):
+                first_sample = self.sample_generator.get("Publication", pool=self.template_pool(template), rng=rng)
+        else:
+            first_sample = self.sample_generator.get("Publication", pool=self.template_pool(template), rng=rng)
+            second_sample = self.sample_generator.get("Publication", rng=rng)
+
+        # Reject the samples before filling if the question could not be valid
+        slots = self.slot_values(first_sample, second_sample, rng)
+        reason = self.preflight(template, slots)
+        if reason:
+            self.reject(template, reason)
+            return None
+
+        # Fill in the template with the sample
+        question, paraphrase, query, entities, _ = self.fill_slots(template, first_sample, second_sample, group, rng, slots)
+        return template, question, paraphrase, query, entities
+
+    def is_valid(self, candidate, answers):
+        _, question, paraphrase, _, _ = candidate
+        return bool(answers) and not re.search("NONE", question) and not re.search("NONE", paraphrase)
+
+    def answered(self, group, slots, fill_workers=1, concurrency=1, batch_size=1, scheduler=None):
+        """
+            Yield (slot, candidate, answers) for question slots (entity type, query type,
+            index) in order: for each slot, its attempts up to the first valid one, or
+            only its invalid attempts if the scheduler gave it up. Attempts rejected
+            before filling are not executed and not yielded. The scheduler picks the attempts
+            to make across buckets within its lookahead of the first slot not yet
+            yielded. Templates are filled by fill_workers threads and
+            executed by concurrency threads taking batch_size queries at a time,
+            connected by bounded queues. Only one attempt per slot is in the pipeline
+            at a time, so no query is wasted, and as every slot has its own random
+            stream the output does not depend on the stage sizes
+        """
+        scheduler = scheduler or QuotaScheduler(slots)
+        results = queue.Queue()
+        stages = []
+        if fill_workers <= 1 and concurrency <= 1 and batch_size <= 1:
+            window = 1
+            def submit(task):
+                candidate = self.candidate(group, *slots[task[0]], task[1])
+                results.put(((task, candidate), self.execute(candidate[0], candidate[3]) if candidate else None))
+        else:
+            executions = max(1, concurrency) * max(1, batch_size)
+            window = 2 * executions + max(1, fill_workers)
+            execute = Stage(
+                "execute", lambda tasks: zip(tasks, self.execute_batch([candidate for _, candidate in tasks])),
+                results, concurrency, 2 * executions, batch_size)
+            def fill_batch(tasks):
+                # Rejected candidates skip the execute stage
+                filled = []
+                for task in tasks:
+                    candidate = self.candidate(group, *slots[task[0]], task[1])
+                    if candidate:
+                        filled.append((task, candidate))
+                    else:
+                        results.put(((task, None), None))
+                return filled
+            fill = Stage("fill", fill_batch, execute, fill_workers, window, errors=results)
+            stages = [execute.start(), fill.start()]
+            submit = fill.put
+
+        history = {position: [] for position in range(len(slots))}
+        finished = set()
+        in_flight = set()
+        position = 0
+        try:
+            while True:
+                while position < len(slots) and position not in in_flight and (
+                        position in finished or position in scheduler.abandoned):
+                    given_up = position in scheduler.abandoned
+                    for candidate, answers in history.pop(position):
+                        if not (given_up and self.is_valid(candidate, answers)):
+                            yield slots[position], candidate, answers
+                    position += 1
+                if position == len(slots):
+                    break
+                while len(in_flight) < window:
+                    task = scheduler.next(position)
+                    if task is None:
+                        break
+                    submit(task)
+                    in_flight.add(task[0])
+                result = results.get()
+                if isinstance(result, Exception):
+                    raise result
+                ((done, attempt), candidate), answers = result
+                in_flight.discard(done)
+                if candidate:
+                    history[done].append((candidate, answers))
+                if not scheduler.record(done, attempt, bool(candidate) and self.is_valid(candidate, answers)):
+                    finished.add(done)
+        finally:
+            for stage in reversed(stages):
+                stage.close(cancel=True)
+            for stage in reversed(stages):
+                stage.report()
+
+    def generate(self, group, num_samples, concurrency=1, batch_size=1, shard=0, shards=1, fill_workers=1, resume=None,
+                 bucket_attempts=None, bucket_time=None, sample_reuse=1, lookahead=256, abandon=None):
+        """
+            Generate question-query pairs, filling templates in fill_workers
+            threads and executing up to concurrency batches of batch_size
+            queries at a time. Attempts are spread over the unfilled buckets of
+            the next lookahead question slots, and a bucket is abandoned after bucket_attempts attempts or
+            bucket_time seconds. With sample_reuse, a sample pair is shared by
+            that many buckets. Every question slot has its own random stream,
+            and with several shards each generates a contiguous range of every
+            bucket's slots. resume holds the counts and ID counters of a
+            checkpoint, and the slots its valid questions completed are skipped,
+            as are the slots its abandoned buckets gave up. abandon is called with
+            the entity type, query type and number of completed slots of every
+            bucket this run abandons
         """
 
         valid_query_count_dict = {
@@ -302,57 +736,97 @@ class DataGenerator:
             "CREATOR": {query_type: 0 for query_type in self.query_types}
         }
         
-        required_sample_size = (num_samples / len(self.entity_types)) / len(self.query_types)
+        required_sample_size = math.ceil((num_samples / len(self.entity_types)) / len(self.query_types))
+        indices = range(required_sample_size * shard // shards, required_sample_size * (shard + 1) // shards)
 
         valid_query_index = 0
         invalid_query_index = 0
-
-        for entity_type in self.entity_types:
-            for query_type in self.query_types:
-                
-                while valid_query_count_dict[entity_type][query_type] < required_sample_size:
-                    
-                    # Get two random samples
-                    first_sample = self.sample_generator.get("Publication")
-                    second_sample = self.sample_generator.get("Publication")
-
-                    # Withold test_only templates for the train set
-                    selected_templates = templates[entity_type][query_type]
-                    if group == "train":
-                        selected_templates = [template for template in selected_templates if not template["test_only"]]
-
-                    # Get a random template for entity type and query type
-                    template = random.choice(selected_templates)
-
-                    # Fill in the template with the sample
-                    question, paraphrase, query, entities, _ = self.fill_slots(template, first_sample, second_sample, group)
-                    answers = self.server.query(query)
-
-                    if answers and not re.search("NONE", question) and not re.search("NONE", paraphrase):
-                        valid_query_index += 1
-                        valid_query_count_dict[entity_type][query_type] += 1
-                        id = "Q"+str(valid_query_index).zfill(4) # Q0001, Q0002, ...
-                    else:
-                        invalid_query_index += 1
-                        invalid_query_count_dict[entity_type][query_type] += 1
-                        id = "Q"+str(invalid_query_index).zfill(4)
-
-                    yield id, {
-                            "query_type": query_type,
-                            "question": {
-                                "string": question
-                            },
-                            "paraphrased_question": {
-                                "string": paraphrase
-                            },
-                            "query": {
-                                "sparql": query,
-                            },
-                            "template_id": template["id"],
-                            "entities": entities,
-                            "relations": template["question"]["relations"],
-                            "temporal": template["query"]["temporal"],
-                            "held_out": template["test_only"],
-                        }, {
-                            "answer": answers
-                        }
+        dropped_query_count = 0
+        abandoned = {}
+
+        if resume:
+            valid_query_count_dict = resume["valid_query_count_dict"]
+            invalid_query_count_dict = resume["invalid_query_count_dict"]
+            valid_query_index = resume["valid_query_index"]
+            invalid_query_index = resume["invalid_query_index"]
+            abandoned = resume.get("abandoned", {})
+
+        if self.batcher:
+            self.batcher.batch_size = max(1, batch_size)
+        self.sample_reuse = max(1, sample_reuse)
+
+        # A bucket's slots are completed in order, one valid question each,
+        # and an abandoned bucket gave up all slots after its completed ones
+        slots = [
+            (entity_type, query_type, index)
+            for entity_type in self.entity_types for query_type in self.query_types for index in indices
+            if valid_query_count_dict[entity_type][query_type] <= index - indices.start <
+                abandoned.get(entity_type, {}).get(query_type, math.inf)]
+        for entity_type, query_types in abandoned.items():
+            for query_type in query_types:
+                logging.info(f" Skipping {entity_type}/{query_type}, it was abandoned before resuming")
+
+        def on_abandon(key, first):
+            if abandon:
+                abandon(*key, slots[first][2] - indices.start)
+
+        # The lookahead has to cover every attempt the pipeline holds
+        window = 2 * max(1, concurrency) * max(1, batch_size) + max(1, fill_workers)
+        scheduler = QuotaScheduler(slots, bucket_attempts, bucket_time, max(lookahead, window), on_abandon=on_abandon)
+        with closing(self.answered(group, slots, fill_workers, concurrency, batch_size, scheduler)) as answered:
+            for (entity_type, query_type, _), candidate, answers in answered:
+                template, question, paraphrase, query, entities = candidate
+
+                # Unanswered queries are dropped rather than recorded as failed
+                if answers is None:
+                    dropped_query_count += 1
+                    continue
+
+                if self.is_valid(candidate, answers):
+                    valid_query_index += 1
+                    valid_query_count_dict[entity_type][query_type] += 1
+                    id = "Q"+str(valid_query_index).zfill(4) # Q0001, Q0002, ...
+                else:
+                    invalid_query_index += 1
+                    invalid_query_count_dict[entity_type][query_type] += 1
+                    id = "Q"+str(invalid_query_index).zfill(4)
+
+                yield id, {
+                        "query_type": query_type,
+                        "question": {
+                            "string": question
+                        },
+                        "paraphrased_question": {
+                            "string": paraphrase
+                        },
+                        "query": {
+                            "sparql": query,
+                        },
+                        "template_id": template["id"],
+                        "entities": entities,
+                        "relations": template["question"]["relations"],
+                        "temporal": template["query"]["temporal"],
+                        "held_out": template["test_only"],
+                    }, {
+                        "answer": answers
+                    }
+
+        scheduler.report()
+        self.report_rejections()
+        logging.info(f" Sample acceptance rate: {self.sample_generator.acceptance_rate():.2%}")
+        if self.shared_draws:
+            logging.info(f" {self.shared_draws} shared sample pairs were used by {self.shared_uses} candidates")
+        if self.keyword_generator.index is not None:
+            logging.info(
+                f" Keyword index answered {self.keyword_generator.lookups} titles, "
+                f"{self.keyword_generator.extracted} were extracted with spacy")
+        if dropped_query_count:
+            logging.warning(f" Dropped {dropped_query_count} queries the server did not answer")
+        if self.executor:
+            logging.info(f" Compiled executors answered {self.executor.hits} queries, {self.executor.misses} went to the server")
+        if self.cache is not None:
+            self.cache.report()
+        if self.batcher and self.batcher.batches:
+            self.batcher.report()
+        if self.client:
+            self.client.report()
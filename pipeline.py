@@ -0,0 +1,214 @@
+"""
+    Bounded-queue pipeline for generation: worker threads filling templates,
+    worker threads executing the filled queries and a single ordered writer.
+    Every stage reports its queue depth and throughput
+"""
+import time
+import queue
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO)
+
+# Put once per worker to stop a stage
+DONE = object()
+
+
+class Stage:
+    """
+        Worker threads taking up to batch_size items at a time from a bounded
+        input queue and putting the items function returns for them to output.
+        An exception raised by function is put to errors instead
+    """
+    def __init__(self, name, function, output, workers=1, maxsize=0, batch_size=1, errors=None):
+        self.name = name
+        self.function = function
+        self.output = output
+        self.errors = errors if errors is not None else output
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self.batch_size = max(1, batch_size)
+        self.input = queue.Queue(maxsize)
+        self.threads = [
+            threading.Thread(target=self.__run, name=f"{name}-{worker}", daemon=True)
+            for worker in range(self.workers)]
+
+        self.lock = threading.Lock()
+        self.started = None
+        self.stopped = None
+        self.processed = 0
+        self.busy = 0.0
+        self.puts = 0
+        self.depth = 0
+        self.max_depth = 0
+
+    def __repr__(self):
+        return f"Stage(name={self.name}, workers={self.workers}, processed={self.processed}, depth={self.input.qsize()})"
+
+    def start(self):
+        self.started = time.perf_counter()
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def put(self, item):
+        """
+            Queue an item for the stage, blocking while the queue is full
+        """
+        self.input.put(item)
+        depth = self.input.qsize()
+        with self.lock:
+            self.puts += 1
+            self.depth += depth
+            self.max_depth = max(self.max_depth, depth)
+
+    def close(self, cancel=False):
+        """
+            Stop the workers once they have taken the items already queued,
+            or discard those items first if cancel is set
+        """
+        while cancel:
+            try:
+                self.input.get_nowait()
+            except queue.Empty:
+                break
+        for _ in self.threads:
+            self.input.put(DONE)
+        for thread in self.threads:
+            thread.join()
+        self.stopped = time.perf_counter()
+
+    def __run(self):
+        done = False
+        while not done:
+            items = [self.input.get()]
+            if items[0] is DONE:
+                break
+            while len(items) < self.batch_size:
+                try:
+                    item = self.input.get_nowait()
+                except queue.Empty:
+                    break
+                if item is DONE:
+                    done = True
+                    break
+                items.append(item)
+
+            start = time.perf_counter()
+            try:
+                results = self.function(items)
+            except Exception as error:
+                results = []
+                self.errors.put(error)
+            with self.lock:
+                self.busy += time.perf_counter() - start
+                self.processed += len(items)
+            for result in results:
+                self.output.put(result)
+
+    def throughput(self):
+        """
+            Return the items processed per second since the stage started
+        """
+        elapsed = (self.stopped or time.perf_counter()) - self.started if self.started else 0.0
+        return self.processed / elapsed if elapsed else 0.0
+
+    def utilization(self):
+        """
+            Return the fraction of the workers' time spent processing items
+        """
+        elapsed = (self.stopped or time.perf_counter()) - self.started if self.started else 0.0
+        return self.busy / (elapsed * self.workers) if elapsed else 0.0
+
+    def report(self):
+        mean_depth = self.depth / self.puts if self.puts else 0.0
+        logging.info(
+            f" {self.name.capitalize()} stage: {self.workers} workers, {self.processed} items at {self.throughput():.1f}/s, "
+            f"{self.utilization():.0%} busy, queue depth {mean_depth:.1f} mean / {self.max_depth} max of {self.maxsize or 'unbounded'}")
+
+
+class Writer:
+    """
+        A single thread consuming the items of a bounded queue in the order they were put
+    """
+    def __init__(self, consume, maxsize=1024, name="write"):
+        self.consume = consume
+        self.name = name
+        self.maxsize = maxsize
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self.finished = False
+        self.started = None
+        self.stopped = None
+        self.processed = 0
+        self.waiting = 0.0
+        self.puts = 0
+        self.depth = 0
+        self.max_depth = 0
+
+    def __repr__(self):
+        return f"Writer(name={self.name}, processed={self.processed}, depth={self.queue.qsize()})"
+
+    def __items(self):
+        while True:
+            start = time.perf_counter()
+            item = self.queue.get()
+            self.waiting += time.perf_counter() - start
+            if item is DONE:
+                self.finished = True
+                return
+            self.processed += 1
+            yield item
+
+    def __run(self):
+        try:
+            self.consume(self.__items())
+        except Exception as error:
+            self.error = error
+            # Keep draining so the producer is not blocked on a full queue,
+            # unless consume already took the only DONE
+            while not self.finished and self.queue.get() is not DONE:
+                pass
+
+    def write(self, items):
+        """
+            Put the items to the queue as they are produced while the writer
+            thread consumes them, and wait for it to finish
+        """
+        self.started = time.perf_counter()
+        self.finished = False
+        thread = threading.Thread(target=self.__run, name=self.name, daemon=True)
+        thread.start()
+        try:
+            for item in items:
+                self.queue.put(item)
+                depth = self.queue.qsize()
+                self.puts += 1
+                self.depth += depth
+                self.max_depth = max(self.max_depth, depth)
+        finally:
+            self.queue.put(DONE)
+            thread.join()
+            self.stopped = time.perf_counter()
+        if self.error:
+            raise self.error
+
+    def throughput(self):
+        """
+            Return the items written per second
+        """
+        elapsed = (self.stopped or time.perf_counter()) - self.started if self.started else 0.0
+        return self.processed / elapsed if elapsed else 0.0
+
+    def utilization(self):
+        """
+            Return the fraction of the writer's time not spent waiting for items
+        """
+        elapsed = (self.stopped or time.perf_counter()) - self.started if self.started else 0.0
+        return max(0.0, 1 - self.waiting / elapsed) if elapsed else 0.0
+
+    def report(self):
+        mean_depth = self.depth / self.puts if self.puts else 0.0
+        logging.info(
+            f" {self.name.capitalize()} stage: 1 worker, {self.processed} items at {self.throughput():.1f}/s, "
+            f"{self.utilization():.0%} busy, queue depth {mean_depth:.1f} mean / {self.max_depth} max of {self.maxsize or 'unbounded'}")
@@ -0,0 +1,200 @@
+"""
+    Structural preconditions of templates and the pools of
+    publications that meet them, used for targeted sampling
+"""
+import json
+import hashlib
+import logging
+from collections import Counter
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+# Papers an author needs in the venue of a publication, counting the publication itself
+MIN_VENUE_PAPERS = 2
+
+def dblp_prefix(predicate):
+    return f"<https://dblp.org/rdf/schema#{predicate}>"
+
+# Conditions on the first sampled publication of each template.
+# "creator_*" must hold for every author since fill_slots picks the creator at random,
+# "author_*" must hold for at least one author.
+# "*_venue_papers" needs another paper of the author in the publication's venue.
+PRECONDITIONS = {
+    "TP11": ["author_affiliation"],
+    "TP12": ["author_other_publications"],
+    "TP13": ["author_other_publications"],
+    "TP14": ["author_webpage"],
+    "TP15": ["author_orcid"],
+    "TP16": ["author_other_publications"],
+    "TP22": ["author_affiliation"],
+    "TP23": ["author_other_publications"],
+    "TP24": ["author_other_publications"],
+    "TP33": ["creator_affiliation"],
+    "TP71": ["creator_affiliation"],
+    "TP73": ["author_affiliation"],
+    "TP75": ["author_venue_papers"],
+    "TP81": ["author_affiliation"],
+    "TP82": ["author_other_publications"],
+    "TP84": ["author_other_publications"],
+    "TP93": ["creator_affiliation"],
+    "TC02": ["creator_affiliation"],
+    "TC03": ["creator_orcid"],
+    "TC04": ["creator_wikidata"],
+    "TC05": ["creator_webpage"],
+    "TC12": ["multiple_authors"],
+    "TC14": ["multiple_authors"],
+    "TC16": ["creator_affiliation"],
+    "TC17": ["multiple_authors"],
+    "TC22": ["multiple_authors"],
+    "TC32": ["multiple_authors"],
+    "TC43": ["multiple_authors"],
+    "TC53": ["multiple_authors"],
+    "TC54": ["creator_affiliation"],
+    "TC61": ["multiple_authors"],
+    "TC62": ["multiple_authors"],
+    "TC64": ["multiple_authors", "creator_affiliation"],
+    "TC72": ["creator_venue_papers"],
+    "TC73": ["multiple_authors"],
+    "TC74": ["multiple_authors"],
+    "TC84": ["multiple_authors"]
+}
+
+CREATOR_EDGES = {
+    "affiliation": dblp_prefix("primaryAffiliation"),
+    "orcid": dblp_prefix("orcid"),
+    "wikidata": dblp_prefix("wikidata"),
+    "webpage": dblp_prefix("webpage")
+}
+
+
+class TemplateIndex:
+    """
+        Pools of publications meeting the preconditions of each template.
+        Pools hold positions in the graph's valid sample index (or vertex
+        index if the graph has none), as used by Graph.random_vertices,
+        and are only meaningful for the graph with the fingerprint they were built from
+    """
+    def __init__(self, _type="Publication"):
+        self._type = _type
+        self.valid = False
+        self.fingerprint = None
+        self.masks = {}
+        self.pools = {}
+
+    def __repr__(self):
+        return f"TemplateIndex(type={self._type}, templates={len(self.pools)})"
+
+    def graph_fingerprint(self, graph):
+        """
+            Hash of the size and some vertices of the graph's index that pool positions refer to
+        """
+        valid = len(graph.valid_index.get(self._type, [])) > 0
+        size = graph.pool_size(self._type, valid)
+        probes = [graph.vertex_at(self._type, position, valid) for position in sorted({0, size // 3, size // 2, size - 1}) if size]
+        summary = json.dumps([graph.label, self._type, valid, size, probes])
+        return hashlib.sha256(summary.encode("utf-8")).hexdigest()
+
+    def matches(self, graph):
+        """
+            Whether the index was built from the graph
+        """
+        return self.fingerprint is not None and self.fingerprint == self.graph_fingerprint(graph)
+
+    def conditions(self, graph, vertex):
+        """
+            Return the conditions a publication meets
+        """
+        view = graph.subgraph(self._type, vertex)
+        authors = view.neighbours(dblp_prefix("authoredBy"))
+        met = set()
+        if len(authors) > 1:
+            met.add("multiple_authors")
+        for name, edge in CREATOR_EDGES.items():
+            has_edge = [bool(author.get(edge)) for author in authors]
+            if has_edge and all(has_edge):
+                met.add("creator_" + name)
+            if any(has_edge):
+                met.add("author_" + name)
+        if any(len(author.get(dblp_prefix("authorOf"), ())) > 1 for author in authors):
+            met.add("author_other_publications")
+        return met
+
+    def build(self, graph):
+        """
+            Build the condition masks and template pools from the graph
+        """
+        self.valid = len(graph.valid_index.get(self._type, [])) > 0
+        self.fingerprint = self.graph_fingerprint(graph)
+        size = graph.pool_size(self._type, self.valid)
+
+        names = {condition for conditions in PRECONDITIONS.values() for condition in conditions}
+        self.masks = {name: np.zeros(size, dtype=bool) for name in names}
+        venues = []
+        venue_papers = Counter() # (author, venue) -> papers in the pool
+        for position in range(size):
+            vertex = graph.vertex_at(self._type, position, self.valid)
+            for condition in self.conditions(graph, vertex) & names:
+                self.masks[condition][position] = True
+            venue = graph.objects(self._type, vertex, dblp_prefix("publishedIn"))[:1]
+            venues.append(venue[0] if venue else None)
+            if venue:
+                for author in graph.objects(self._type, vertex, dblp_prefix("authoredBy")):
+                    venue_papers[author, venue[0]] += 1
+
+        self.masks["creator_venue_papers"] = np.zeros(size, dtype=bool)
+        self.masks["author_venue_papers"] = np.zeros(size, dtype=bool)
+        for position, venue in enumerate(venues):
+            if venue is None:
+                continue
+            vertex = graph.vertex_at(self._type, position, self.valid)
+            enough = [venue_papers[author, venue] >= MIN_VENUE_PAPERS
+                for author in graph.objects(self._type, vertex, dblp_prefix("authoredBy"))]
+            self.masks["creator_venue_papers"][position] = bool(enough) and all(enough)
+            self.masks["author_venue_papers"][position] = any(enough)
+
+        for template_id, conditions in PRECONDITIONS.items():
+            mask = np.ones(size, dtype=bool)
+            for condition in conditions:
+                mask &= self.masks[condition]
+            self.pools[template_id] = np.flatnonzero(mask).astype(np.int32)
+            if not len(self.pools[template_id]):
+                logging.warning(f" No publications meet the preconditions of {template_id}")
+        return self
+
+    def pool(self, template_id):
+        """
+            Return the pool for a template, or None if it is unconstrained or empty
+        """
+        pool = self.pools.get(template_id)
+        return pool if pool is not None and len(pool) else None
+
+    def contains(self, template_id, position):
+        """
+            Whether the publication at an index position meets the preconditions of a template
+        """
+        pool = self.pool(template_id)
+        if pool is None:
+            return True
+        index = np.searchsorted(pool, position)
+        return bool(index < len(pool) and pool[index] == position)
+
+    def save(self, file):
+        """
+            Save the pools to a NumPy archive
+        """
+        np.savez_compressed(file, _type=self._type, valid=self.valid, fingerprint=self.fingerprint, **self.pools)
+        logging.info(f" Template index saved to {file}")
+
+    def load(self, file):
+        """
+            Load the pools from a NumPy archive
+        """
+        with np.load(file) as archive:
+            self._type = str(archive["_type"])
+            self.valid = bool(archive["valid"])
+            self.fingerprint = str(archive["fingerprint"]) if "fingerprint" in archive.files else None
+            self.pools = {key: archive[key] for key in archive.files if key not in ("_type", "valid", "fingerprint")}
+        logging.info(f" Template index loaded from {file}")
+        return self
@@ -0,0 +1,167 @@
+"""
+    Scheduling of question slot attempts across (entity type, query type)
+    buckets, weighted by how many attempts each bucket still needs
+"""
+import time
+import heapq
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+# Attempts of a bucket before its acceptance rate is trusted for a projection
+MIN_ATTEMPTS = 20
+
+
+class Bucket:
+    """
+        Attempt counts of the question slots of a bucket and the attempts waiting to be made
+    """
+    def __init__(self, key, order):
+        self.key = key
+        self.order = order
+        self.waiting = [] # (slot position, attempt), a heap
+        self.positions = []
+        self.unfinished = set()
+        self.slots = 0
+        self.remaining = 0
+        self.attempts = 0
+        self.accepted = 0
+        self.in_flight = 0
+        self.started = None
+        self.abandoned = False
+        self.warned = False
+
+    def __repr__(self):
+        return f"Bucket(key={self.key}, accepted={self.accepted}, attempts={self.attempts}, remaining={self.remaining})"
+
+    def acceptance_rate(self):
+        """
+            Estimate of the fraction of attempts that give a valid question,
+            starting from one half before any attempt
+        """
+        return (self.accepted + 1) / (self.attempts + 2)
+
+    def expected_attempts(self):
+        """
+            Expected number of attempts to complete the remaining slots
+        """
+        return self.remaining / self.acceptance_rate()
+
+
+class QuotaScheduler:
+    """
+        Chooses the next attempt among the unfinished slots of all buckets,
+        the slots given as (entity type, query type, index). The bucket with the
+        most expected attempts left per attempt in flight goes next, so buckets
+        with low acceptance rates get more attempts and all buckets finish
+        together. A bucket is abandoned once it has made max_attempts attempts
+        or spent max_time seconds, and reported as soon as its acceptance rate
+        projects it past either budget. Abandoning gives up the bucket's slots
+        from its first unfinished one on, so that the slots a bucket completed
+        are always its first ones. Only slots less than lookahead positions past
+        the first unwritten one are attempted, which bounds the finished slots
+        waiting to be written. on_abandon is called with the key of an abandoned
+        bucket and the position of its first given up slot
+    """
+    def __init__(self, slots, max_attempts=None, max_time=None, lookahead=None, clock=time.monotonic, on_abandon=None):
+        self.max_attempts = max_attempts
+        self.max_time = max_time
+        self.lookahead = lookahead
+        self.clock = clock
+        self.on_abandon = on_abandon
+        self.buckets = {}
+        self.slot_buckets = []
+        self.abandoned = set()
+        for position, (entity_type, query_type, _) in enumerate(slots):
+            key = (entity_type, query_type)
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = Bucket(key, len(self.buckets))
+            bucket.waiting.append((position, 0))
+            bucket.positions.append(position)
+            bucket.unfinished.add(position)
+            bucket.slots += 1
+            bucket.remaining += 1
+            self.slot_buckets.append(bucket)
+
+    def __repr__(self):
+        return f"QuotaScheduler(buckets={len(self.buckets)}, abandoned={len(self.abandoned)})"
+
+    def next(self, frontier=0):
+        """
+            Return the next attempt to make as (slot position, attempt), or None
+            if no slot within the lookahead of the frontier is waiting for one
+        """
+        limit = frontier + self.lookahead if self.lookahead else float("inf")
+        ready = [bucket for bucket in self.buckets.values() if bucket.waiting and bucket.waiting[0][0] < limit]
+        if not ready:
+            return None
+        bucket = max(ready, key=lambda bucket: (bucket.expected_attempts() / (bucket.in_flight + 1), -bucket.order))
+        if bucket.started is None:
+            bucket.started = self.clock()
+        bucket.in_flight += 1
+        return heapq.heappop(bucket.waiting)
+
+    def record(self, position, attempt, valid):
+        """
+            Record the outcome of an attempt. Return whether the slot is retried,
+            which it is not if it is complete or has been given up
+        """
+        bucket = self.slot_buckets[position]
+        bucket.in_flight -= 1
+        bucket.attempts += 1
+        if position in self.abandoned:
+            return False
+        if valid:
+            bucket.accepted += 1
+            bucket.remaining -= 1
+            bucket.unfinished.discard(position)
+            return False
+        if self.__over_budget(bucket):
+            self.__abandon(bucket)
+            return False
+        self.__check(bucket)
+        heapq.heappush(bucket.waiting, (position, attempt + 1))
+        return True
+
+    def __over_budget(self, bucket):
+        return (
+            (self.max_attempts is not None and bucket.attempts >= self.max_attempts) or
+            (self.max_time is not None and self.clock() - bucket.started >= self.max_time))
+
+    def __abandon(self, bucket):
+        first = min(bucket.unfinished)
+        bucket.abandoned = True
+        bucket.waiting = []
+        self.abandoned.update(position for position in bucket.positions if position >= first)
+        bucket.remaining = sum(position >= first for position in bucket.positions)
+        logging.warning(
+            f" Abandoning {'/'.join(bucket.key)} after {bucket.attempts} attempts, "
+            f"{bucket.slots - bucket.remaining} of {bucket.slots} questions generated")
+        if self.on_abandon:
+            self.on_abandon(bucket.key, first)
+
+    def __check(self, bucket):
+        """
+            Report a bucket once its acceptance rate projects it past its budget
+        """
+        if bucket.warned or bucket.attempts < MIN_ATTEMPTS:
+            return
+        expected = bucket.expected_attempts()
+        elapsed = self.clock() - bucket.started
+        hopeless = (
+            (bucket.accepted == 0) or
+            (self.max_attempts is not None and bucket.attempts + expected > self.max_attempts) or
+            (self.max_time is not None and elapsed + elapsed / bucket.attempts * expected > self.max_time))
+        if hopeless:
+            bucket.warned = True
+            logging.warning(
+                f" {'/'.join(bucket.key)} accepted {bucket.accepted} of {bucket.attempts} attempts "
+                f"and needs about {expected:.0f} more for its {bucket.remaining} remaining questions")
+
+    def report(self):
+        for bucket in self.buckets.values():
+            logging.info(
+                f" {'/'.join(bucket.key)}: {bucket.slots - bucket.remaining} of {bucket.slots} questions "
+                f"in {bucket.attempts} attempts ({bucket.accepted / bucket.attempts if bucket.attempts else 0.0:.0%} accepted)"
+                + (", abandoned" if bucket.abandoned else ""))
@@ -0,0 +1,740 @@
+"""
+    In-process evaluation of the SPARQL subset used by the templates
+    against the local graph, as an alternative to the DBLP server
+"""
+import re
+import logging
+from datetime import datetime
+
+logging.basicConfig(level=logging.INFO)
+
+# Predicates whose inverse is stored on the object, used to join
+# patterns like "?x authoredBy <creator>" without scanning the graph
+INVERSE_PREDICATES = {
+    "<https://dblp.org/rdf/schema#authoredBy>": "<https://dblp.org/rdf/schema#authorOf>",
+    "<https://dblp.org/rdf/schema#authorOf>": "<https://dblp.org/rdf/schema#authoredBy>",
+    "<https://dblp.org/rdf/schema#createdBy>": "<https://dblp.org/rdf/schema#creatorOf>",
+    "<https://dblp.org/rdf/schema#creatorOf>": "<https://dblp.org/rdf/schema#createdBy>",
+    "<https://dblp.org/rdf/schema#editedBy>": "<https://dblp.org/rdf/schema#editorOf>",
+    "<https://dblp.org/rdf/schema#editorOf>": "<https://dblp.org/rdf/schema#editedBy>"
+}
+
+AGGREGATES = {"COUNT", "SUM", "AVG", "MIN", "MAX", "GROUP_CONCAT", "SAMPLE"}
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+NUMBER = re.compile(r"[+-]?\d+(\.\d*)?([eE][+-]?\d+)?")
+
+TOKENS = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<iri><[^<>\s]*>)
+  | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")(?P<suffix>\^\^<[^<>\s]*>|@[A-Za-z-]+)?
+  | (?P<var>[?$]\w+)
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<op>!=|<=|>=|&&|\|\||[=<>+\-*/!])
+  | (?P<punct>[{}().,;])
+  | (?P<name>[A-Za-z_]\w*(?::\w*)?)
+""", re.VERBOSE)
+
+
+def tokenize(query):
+    """
+        Split a query into (kind, value) tokens
+    """
+    tokens, position = [], 0
+    while position < len(query):
+        match = TOKENS.match(query, position)
+        if not match:
+            raise SyntaxError(f"Unexpected character at {position}: {query[position:position + 20]}")
+        position = match.end()
+        kind = match.lastgroup if match.lastgroup != "suffix" else "string"
+        if kind == "space":
+            continue
+        if kind == "string":
+            # Literals are kept in graph form: "value" plus datatype or language suffix
+            tokens.append(("term", '"' + match.group("string")[1:-1] + '"' + (match.group("suffix") or "")))
+        elif kind == "iri":
+            tokens.append(("term", match.group()))
+        elif kind == "number":
+            tokens.append(("term", float(match.group()) if "." in match.group() else int(match.group())))
+        elif kind == "name":
+            tokens.append(("name", match.group()))
+        else:
+            tokens.append((kind, match.group()))
+    return tokens
+
+
+class Parser:
+    """
+        Recursive descent parser producing a nested tuple/dict query tree
+    """
+    def __init__(self, query):
+        self.tokens = tokenize(query)
+        self.position = 0
+
+    def peek(self, offset=0):
+        position = self.position + offset
+        return self.tokens[position] if position < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def accept(self, value):
+        kind, token = self.peek()
+        if kind in ("name", "punct", "op") and isinstance(token, str) and token.upper() == value:
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, value):
+        if not self.accept(value):
+            raise SyntaxError(f"Expected {value}, got {self.peek()[1]}")
+
+    def parse(self):
+        """
+            Parse a complete SELECT or ASK query
+        """
+        if self.accept("ASK"):
+            query = {"form": "ASK", "where": self.group()}
+        else:
+            query = self.select()
+        if self.peek()[0] is not None:
+            raise SyntaxError(f"Unexpected token {self.peek()[1]}")
+        return query
+
+    def select(self):
+        self.expect("SELECT")
+        query = {"form": "SELECT", "distinct": self.accept("DISTINCT"), "projection": []}
+
+        while not (self.peek() == ("punct", "{") or self.peek()[0] == "name" and self.peek()[1].upper() == "WHERE"):
+            kind, token = self.peek()
+            if kind == "var":
+                self.next()
+                query["projection"].append((token[1:], None))
+            elif self.accept("("):
+                expression = self.expression()
+                self.expect("AS")
+                query["projection"].append((self.next()[1][1:], expression))
+                self.expect(")")
+            elif kind == "name":
+                # Virtuoso also accepts "MIN(?x) AS ?y" without brackets
+                expression = self.expression()
+                self.expect("AS")
+                query["projection"].append((self.next()[1][1:], expression))
+            elif kind == "op" and token == "*":
+                self.next()
+                query["projection"].append(("*", None))
+            else:
+                raise SyntaxError(f"Unexpected token {token} in projection")
+
+        self.accept("WHERE")
+        query["where"] = self.group()
+
+        query["group_by"], query["order_by"], query["limit"], query["offset"] = [], [], None, 0
+        if self.accept("GROUP"):
+            self.expect("BY")
+            while self.peek()[0] == "var":
+                query["group_by"].append(self.next()[1][1:])
+        if self.accept("ORDER"):
+            self.expect("BY")
+            while True:
+                if self.accept("ASC") or self.peek()[0] == "var":
+                    descending = False
+                elif self.accept("DESC"):
+                    descending = True
+                else:
+                    break
+                if self.peek()[0] == "var":
+                    query["order_by"].append((descending, ("var", self.next()[1][1:])))
+                else:
+                    self.expect("(")
+                    query["order_by"].append((descending, self.expression()))
+                    self.expect(")")
+        while self.peek()[0] == "name" and self.peek()[1].upper() in ("LIMIT", "OFFSET"):
+            keyword = self.next()[1].upper()
+            query["limit" if keyword == "LIMIT" else "offset"] = int(self.next()[1])
+        return query
+
+    def group(self):
+        """
+            Parse a { ... } group into a list of elements
+        """
+        self.expect("{")
+        if self.peek()[0] == "name" and self.peek()[1].upper() == "SELECT":
+            subquery = self.select()
+            self.expect("}")
+            return [("subquery", subquery)]
+
+        elements = []
+        while not self.accept("}"):
+            if self.accept("."):
+                continue
+            if self.accept("FILTER"):
+                elements.append(("filter", self.constraint()))
+            elif self.accept("BIND"):
+                self.expect("(")
+                expression = self.expression()
+                self.expect("AS")
+                elements.append(("bind", expression, self.next()[1][1:]))
+                self.expect(")")
+            elif self.accept("VALUES"):
+                elements.append(self.values())
+            elif self.peek() == ("punct", "{"):
+                groups = [self.group()]
+                while self.accept("UNION"):
+                    groups.append(self.group())
+                elements.append(("union", groups) if len(groups) > 1 else ("group", groups[0]))
+            else:
+                elements.extend(self.triples())
+        return elements
+
+    def values(self):
+        """
+            Parse an inline VALUES block into its variables and rows of terms
+        """
+        nested = self.accept("(")
+        variables = []
+        while self.peek()[0] == "var":
+            variables.append(self.next()[1][1:])
+        if nested:
+            self.expect(")")
+        self.expect("{")
+        rows = []
+        while not self.accept("}"):
+            if nested:
+                self.expect("(")
+                row = []
+                while not self.accept(")"):
+                    row.append(self.value())
+                rows.append(row)
+            else:
+                rows.append([self.value()])
+        return ("values", variables, rows)
+
+    def value(self):
+        if self.accept("UNDEF"):
+            return None
+        kind, token = self.next()
+        if kind != "term":
+            raise SyntaxError(f"Unexpected token {token} in VALUES")
+        return token
+
+    def triples(self):
+        """
+            Parse triples sharing a subject, with ; and , lists
+        """
+        subject = self.term()
+        triples = []
+        while True:
+            predicate = self.term()
+            if predicate == ("name", "a"):
+                predicate = ("term", "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>")
+            triples.append(("triple", subject, predicate, self.term()))
+            while self.accept(","):
+                triples.append(("triple", subject, predicate, self.term()))
+            if not self.accept(";"):
+                return triples
+
+    def term(self):
+        kind, token = self.next()
+        if kind == "var":
+            return ("var", token[1:])
+        if kind in ("term", "name"):
+            return (kind, token)
+        raise SyntaxError(f"Unexpected token {token} in triple pattern")
+
+    def constraint(self):
+        if self.accept("NOT"):
+            self.expect("EXISTS")
+            return ("exists", True, self.group())
+        if self.accept("EXISTS"):
+            return ("exists", False, self.group())
+        return self.expression()
+
+    def expression(self):
+        left = self.conjunction()
+        while self.accept("||"):
+            left = ("op", "||", left, self.conjunction())
+        return left
+
+    def conjunction(self):
+        left = self.comparison()
+        while self.accept("&&"):
+            left = ("op", "&&", left, self.comparison())
+        return left
+
+    def comparison(self):
+        left = self.additive()
+        kind, token = self.peek()
+        if kind == "op" and token in ("=", "!=", "<", ">", "<=", ">="):
+            self.next()
+            return ("op", token, left, self.additive())
+        return left
+
+    def additive(self):
+        left = self.multiplicative()
+        while self.peek()[0] == "op" and self.peek()[1] in ("+", "-"):
+            left = ("op", self.next()[1], left, self.multiplicative())
+        return left
+
+    def multiplicative(self):
+        left = self.unary()
+        while self.peek()[0] == "op" and self.peek()[1] in ("*", "/"):
+            left = ("op", self.next()[1], left, self.unary())
+        return left
+
+    def unary(self):
+        if self.accept("!"):
+            return ("not", self.unary())
+        if self.accept("-"):
+            return ("op", "-", ("term", 0), self.unary())
+        return self.primary()
+
+    def primary(self):
+        if self.accept("("):
+            expression = self.expression()
+            self.expect(")")
+            return expression
+        if self.accept("NOT"):
+            self.expect("EXISTS")
+            return ("exists", True, self.group())
+        if self.accept("EXISTS"):
+            return ("exists", False, self.group())
+
+        kind, token = self.next()
+        if kind == "var":
+            return ("var", token[1:])
+        if kind == "term":
+            return ("term", token)
+        if kind == "name":
+            if token.lower() in ("true", "false"):
+                return ("term", token.lower() == "true")
+            name = token.upper()
+            self.expect("(")
+            if name in AGGREGATES:
+                distinct = self.accept("DISTINCT")
+                argument = None if self.accept("*") else self.expression()
+                separator = " "
+                if self.accept(";"):
+                    self.expect("SEPARATOR")
+                    self.expect("=")
+                    separator = lexical(self.next()[1])
+                self.expect(")")
+                return ("aggregate", name, distinct, argument, separator)
+            arguments = []
+            while not self.accept(")"):
+                arguments.append(self.expression())
+                self.accept(",")
+            return ("call", name, arguments)
+        raise SyntaxError(f"Unexpected token {token} in expression")
+
+
+def parse(query):
+    """
+        Parse a query string
+    """
+    return Parser(query).parse()
+
+
+def is_uri(value):
+    return isinstance(value, str) and value.startswith("<")
+
+def is_literal(value):
+    return isinstance(value, str) and value.startswith('"')
+
+def lexical(value):
+    """
+        Return the lexical form of a term or value
+    """
+    if is_literal(value):
+        return value[1:value.rindex('"')]
+    if is_uri(value):
+        return value[1:-1]
+    if isinstance(value, bool):
+        return str(value).lower()
+    return str(value)
+
+def numeric(value):
+    """
+        Return the numeric value of a term or value, or None
+    """
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    if is_literal(value) and NUMBER.fullmatch(lexical(value)):
+        number = float(lexical(value))
+        return int(number) if number.is_integer() else number
+    return None
+
+def same_term(a, b):
+    """
+        Compare two terms, literals by their lexical form
+    """
+    if is_uri(a) or is_uri(b):
+        return a == b
+    return lexical(a) == lexical(b)
+
+def sort_key(value):
+    number = numeric(value)
+    return (0, number, "") if number is not None else (1, 0, lexical(value))
+
+def decode(value):
+    """
+        Decode N-Triples escapes in a literal
+    """
+    if "\\" not in value:
+        return value
+    return re.sub(r"\\u([0-9A-Fa-f]{4})|\\U([0-9A-Fa-f]{8})|\\(.)",
+        lambda match: chr(int(match.group(1) or match.group(2), 16)) if match.group(3) is None
+            else {"n": "\n", "t": "\t", "r": "\r"}.get(match.group(3), match.group(3)), value)
+
+def binding(value):
+    """
+        Format a value as a SPARQL JSON result binding
+    """
+    if isinstance(value, bool):
+        return {"type": "typed-literal", "datatype": XSD + "boolean", "value": str(value).lower()}
+    if isinstance(value, int):
+        return {"type": "typed-literal", "datatype": XSD + "integer", "value": str(value)}
+    if isinstance(value, float):
+        return {"type": "typed-literal", "datatype": XSD + "decimal", "value": str(value)}
+    if is_uri(value):
+        return {"type": "uri", "value": value[1:-1]}
+    suffix = value[value.rindex('"') + 1:]
+    if suffix.startswith("^^"):
+        return {"type": "typed-literal", "datatype": suffix[3:-1], "value": decode(lexical(value))}
+    if suffix.startswith("@"):
+        return {"type": "literal", "xml:lang": suffix[1:], "value": decode(lexical(value))}
+    return {"type": "literal", "value": decode(lexical(value))}
+
+
+class LocalServer:
+    """
+        Evaluate queries against the local graph instead of the DBLP server.
+        Returns results in the same JSON shape as DBLPServer.query
+    """
+    def __init__(self, graph):
+        self.graph = graph
+
+    def query(self, query):
+        """
+            Query the local graph
+        """
+        try:
+            parsed = parse(query)
+        except SyntaxError as error:
+            logging.debug(f" Could not parse query: {error}")
+            return []
+
+        return self.execute(parsed)
+
+    def execute(self, parsed):
+        """
+            Evaluate a parsed query into the server's result format
+        """
+        if parsed["form"] == "ASK":
+            return {"head": {"link": []}, "boolean": bool(self.evaluate_group(parsed["where"], [{}], limit=1))}
+
+        variables, rows = self.select(parsed)
+        return self.results(parsed, variables, rows)
+
+    def results(self, parsed, variables, rows):
+        """
+            Format the rows of a SELECT query as SPARQL JSON results
+        """
+        if not rows:
+            return []
+        return {
+            "head": {"link": [], "vars": variables},
+            "results": {
+                "distinct": parsed["distinct"],
+                "ordered": True,
+                "bindings": [
+                    {variable: binding(value) for variable, value in zip(variables, row) if value is not None}
+                    for row in rows
+                ]
+            }
+        }
+
+    def select(self, query):
+        """
+            Evaluate a SELECT query into projected variables and rows
+        """
+        return self.project(query, self.evaluate_group(query["where"], [{}]))
+
+    def project(self, query, solutions):
+        """
+            Aggregate, order, project and slice the solutions of a SELECT query
+        """
+        projection = query["projection"]
+        if projection == [("*", None)]:
+            projection = [(variable, None) for variable in dict.fromkeys(v for s in solutions for v in s)]
+
+        aggregated = query["group_by"] or any(
+            expression is not None and self.has_aggregate(expression) for _, expression in projection)
+
+        if aggregated:
+            # Like Virtuoso, non-aggregated projected variables are implicitly grouped
+            keys = query["group_by"] + [
+                variable for variable, expression in projection
+                if expression is None and variable not in query["group_by"]]
+            groups = {}
+            for solution in solutions:
+                groups.setdefault(tuple(solution.get(key) for key in keys), []).append(solution)
+            if not groups and not keys:
+                groups[()] = []
+            rows = []
+            for key, members in groups.items():
+                row = dict(zip(keys, key))
+                for variable, expression in projection:
+                    if expression is not None:
+                        row[variable] = self.evaluate(expression, row, members)
+                rows.append(row)
+        else:
+            rows = []
+            for solution in solutions:
+                row = dict(solution)
+                for variable, expression in projection:
+                    if expression is not None:
+                        row[variable] = self.evaluate(expression, row)
+                rows.append(row)
+
+        for descending, expression in reversed(query["order_by"]):
+            rows.sort(key=lambda row: sort_key(self.evaluate(expression, row)), reverse=descending)
+
+        variables = [variable for variable, _ in projection]
+        rows = [tuple(row.get(variable) for variable in variables) for row in rows]
+        if query["distinct"]:
+            rows = list(dict.fromkeys(rows))
+        rows = rows[query["offset"]:]
+        if query["limit"] is not None:
+            rows = rows[:query["limit"]]
+        return variables, rows
+
+    def has_aggregate(self, expression):
+        if expression[0] == "aggregate":
+            return True
+        return any(isinstance(part, tuple) and self.has_aggregate(part) for part in expression[1:]) or (
+            expression[0] == "call" and any(self.has_aggregate(argument) for argument in expression[2]))
+
+    def evaluate_group(self, group, solutions, limit=None):
+        """
+            Evaluate group elements in order, joining each with the solutions so far.
+            Filters apply to the whole group and are evaluated last
+        """
+        filters = []
+        pending = []
+        for element in group + [("end",)]:
+            if element[0] == "triple":
+                pending.append(element)
+                continue
+            if pending:
+                solutions = self.join_triples(pending, solutions)
+                pending = []
+            if element[0] == "filter":
+                filters.append(element[1])
+            elif element[0] == "bind":
+                solutions = [
+                    {**solution, element[2]: self.evaluate(element[1], solution)} for solution in solutions]
+            elif element[0] == "group":
+                solutions = self.evaluate_group(element[1], solutions)
+            elif element[0] == "union":
+                solutions = [result for branch in element[1] for result in self.evaluate_group(branch, solutions)]
+            elif element[0] == "subquery":
+                solutions = self.join_rows(solutions, *self.select(element[1]))
+            elif element[0] == "values":
+                solutions = self.join_rows(solutions, element[1], element[2])
+
+        solutions = [
+            solution for solution in solutions
+            if all(self.truth(self.evaluate(expression, solution)) for expression in filters)]
+        return solutions[:limit] if limit is not None else solutions
+
+    def join_rows(self, solutions, variables, rows):
+        """
+            Join the solutions with rows of values, unbound where None
+        """
+        results = [
+            {variable: value for variable, value in zip(variables, row) if value is not None}
+            for row in rows]
+        return [
+            {**solution, **result} for solution in solutions for result in results
+            if all(same_term(solution[key], value) for key, value in result.items() if key in solution)]
+
+    def join_triples(self, triples, solutions):
+        """
+            Join triple patterns with the solutions, choosing the next pattern
+            by how cheaply it can be looked up given the bound variables
+        """
+        bound = set(solutions[0]) if solutions else set()
+        remaining = list(triples)
+        while remaining and solutions:
+            triple = min(remaining, key=lambda triple: self.cost(triple, bound))
+            remaining.remove(triple)
+            solutions = [result for solution in solutions for result in self.match(triple, solution)]
+            bound |= {term[1] for term in triple[1:] if term[0] == "var"}
+        return solutions
+
+    @staticmethod
+    def cost(triple, bound):
+        _, subject, predicate, _object = triple
+        is_bound = lambda term: term[0] != "var" or term[1] in bound
+        if is_bound(subject):
+            return 0
+        if is_bound(_object) and predicate[1] in INVERSE_PREDICATES:
+            return 1
+        return 2 if is_bound(_object) else 3
+
+    def match(self, triple, solution):
+        """
+            Yield the extensions of a solution that match a triple pattern
+        """
+        _, subject, predicate, _object = triple
+        resolve = lambda term: solution.get(term[1]) if term[0] == "var" else term[1]
+        subject_value, predicate_value, object_value = resolve(subject), resolve(predicate), resolve(_object)
+        if predicate_value is None:
+            return # Variable predicates are not used by the templates
+
+        def bind(subject_term, object_term):
+            if subject_value is not None and not same_term(subject_value, subject_term):
+                return None
+            if object_value is not None and not same_term(object_value, object_term):
+                return None
+            extended = dict(solution)
+            if subject_value is None:
+                extended[subject[1]] = subject_term
+            if object_value is None:
+                extended[_object[1]] = object_term
+            if subject == _object and subject_value is None and subject_term != object_term:
+                return None
+            return extended
+
+        if is_uri(subject_value):
+            candidates = ((subject_value, term) for term in self.graph.objects("Publication", subject_value, predicate_value))
+        elif subject_value is not None:
+            return
+        elif is_uri(object_value) and predicate_value in INVERSE_PREDICATES:
+            candidates = ((term, object_value) for term in
+                self.graph.objects("Publication", object_value, INVERSE_PREDICATES[predicate_value]))
+        else:
+            candidates = ((vertex, term) for vertex in self.graph.all_vertices()
+                for term in self.graph.objects("Publication", vertex, predicate_value))
+
+        for subject_term, object_term in candidates:
+            extended = bind(subject_term, object_term)
+            if extended is not None:
+                yield extended
+
+    def truth(self, value):
+        """
+            Effective boolean value
+        """
+        if value is None:
+            return False
+        if isinstance(value, (bool, int, float)):
+            return bool(value)
+        return bool(lexical(value))
+
+    def evaluate(self, expression, solution, group=None):
+        """
+            Evaluate an expression for a solution, or for a group of solutions
+            if it contains aggregates. Errors evaluate to None
+        """
+        kind = expression[0]
+        if kind == "var":
+            return solution.get(expression[1])
+        if kind == "term":
+            return expression[1]
+        if kind == "not":
+            return not self.truth(self.evaluate(expression[1], solution, group))
+        if kind == "exists":
+            _, negated, pattern = expression
+            return bool(self.evaluate_group(pattern, [solution], limit=1)) != negated
+        if kind == "aggregate":
+            return self.aggregate(expression, group or [])
+        if kind == "call":
+            return self.call(expression[1], [self.evaluate(argument, solution, group) for argument in expression[2]])
+
+        _, operator, left, right = expression
+        left, right = self.evaluate(left, solution, group), self.evaluate(right, solution, group)
+        if operator == "&&":
+            return self.truth(left) and self.truth(right)
+        if operator == "||":
+            return self.truth(left) or self.truth(right)
+        if left is None or right is None:
+            return None
+        if operator in ("+", "-", "*", "/"):
+            left, right = numeric(left), numeric(right)
+            if left is None or right is None or (operator == "/" and right == 0):
+                return None
+            return {"+": left + right, "-": left - right, "*": left * right, "/": left / right if right else None}[operator]
+        if operator in ("=", "!="):
+            equal = numeric(left) == numeric(right) if None not in (numeric(left), numeric(right)) else same_term(left, right)
+            return equal if operator == "=" else not equal
+        left, right = sort_key(left), sort_key(right)
+        if left[0] != right[0]:
+            return None
+        return {"<": left < right, ">": left > right, "<=": left <= right, ">=": left >= right}[operator]
+
+    def call(self, name, arguments):
+        """
+            Evaluate a built-in function
+        """
+        if name == "NOW":
+            return datetime.now()
+        if name == "YEAR":
+            value = arguments[0]
+            if isinstance(value, datetime):
+                return value.year
+            return numeric('"' + lexical(value)[:4] + '"') if value is not None else None
+        if name == "IF":
+            return arguments[1] if self.truth(arguments[0]) else arguments[2]
+        if name in ("XSD:INTEGER", "XSD:INT"):
+            number = numeric(arguments[0])
+            return int(number) if number is not None else None
+        if name in ("XSD:DECIMAL", "XSD:DOUBLE", "XSD:FLOAT"):
+            number = numeric(arguments[0])
+            return float(number) if number is not None else None
+        if name == "STR":
+            return '"' + lexical(arguments[0]) + '"' if arguments[0] is not None else None
+        if name == "BOUND":
+            return arguments[0] is not None
+        logging.debug(f" Unsupported function {name}")
+        return None
+
+    def aggregate(self, expression, group):
+        """
+            Evaluate an aggregate over a group of solutions
+        """
+        _, name, distinct, argument, separator = expression
+        if argument is None:
+            values = [True] * len(group)
+        else:
+            values = [self.evaluate(argument, solution) for solution in group]
+            values = [value for value in values if value is not None]
+        if distinct:
+            values = list(dict.fromkeys(values))
+
+        if name == "COUNT":
+            return len(values)
+        if name == "GROUP_CONCAT":
+            return '"' + separator.join(lexical(value) for value in values) + '"'
+        if name == "SAMPLE":
+            return values[0] if values else None
+        if name in ("MIN", "MAX"):
+            if not values:
+                return None
+            return (min if name == "MIN" else max)(values, key=sort_key)
+
+        numbers = [numeric(value) for value in values]
+        numbers = [number for number in numbers if number is not None]
+        total = sum(numbers)
+        if name == "SUM":
+            return total
+        if not numbers:
+            return 0
+        average = total / len(numbers)
+        return int(average) if float(average).is_integer() else average
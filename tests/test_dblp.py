@@ -0,0 +1,33 @@
+from dblp import Graph, TYPE_PREDICATE, load_chunk, split_ntriple
+
+SCHEMA = "https://dblp.org/rdf/schema#"
+
+TRIPLES = [
+    ("<https://dblp.org/rec/conf/a>", TYPE_PREDICATE, f"<{SCHEMA}Inproceedings>"),
+    ("<https://dblp.org/rec/conf/a>", f"<{SCHEMA}title>", '"A"'),
+    ("<https://dblp.org/rec/conf/a>", f"<{SCHEMA}yearOfPublication>", '"2020"'),
+    # A subject with a type the loader does not know keeps the previous type
+    ("<https://dblp.org/streams/conf/b>", TYPE_PREDICATE, f"<{SCHEMA}Stream>"),
+    ("<https://dblp.org/streams/conf/b>", f"<{SCHEMA}title>", '"B"'),
+    ("<https://dblp.org/streams/conf/b>", f"<{SCHEMA}yearOfPublication>", '"2021"'),
+    ("<https://dblp.org/rec/conf/c>", TYPE_PREDICATE, f"<{SCHEMA}Inproceedings>"),
+    ("<https://dblp.org/rec/conf/c>", f"<{SCHEMA}title>", '"C"'),
+    ("<https://dblp.org/pid/d>", TYPE_PREDICATE, f"<{SCHEMA}Person>"),
+    ("<https://dblp.org/pid/d>", f"<{SCHEMA}primaryCreatorName>", '"D"'),
+]
+
+
+def test_chunks_match_sequential_load_at_unknown_type(tmp_path):
+    path = tmp_path / "sample.nt"
+    path.write_text("".join(f"{subject} {predicate} {_object} .\n" for subject, predicate, _object in TRIPLES))
+    sequential = Graph().load_from_ntriple(str(path), progress=False).data
+    assert "<https://dblp.org/streams/conf/b>" in sequential["Publication"]
+
+    content = path.read_bytes()
+    for chunks in range(2, len(TRIPLES) + 1):
+        ranges = split_ntriple(str(path), chunks)
+        assert all(not content[start:].startswith(b"<https://dblp.org/streams/") for start, _ in ranges)
+        parallel = Graph()
+        for start, end in ranges:
+            parallel.merge(load_chunk((str(path), start, end)))
+        assert parallel.data == sequential, chunks
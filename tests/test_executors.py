@@ -0,0 +1,44 @@
+from dblp import Graph
+from executors import CompiledTemplate, TemplateExecutor
+from templates import templates
+
+
+def template(template_id):
+    return next(
+        template for entity_type in templates.values() for query_type in entity_type.values()
+        for template in query_type if template["id"] == template_id)
+
+
+def fill(template_id, values):
+    sparql = template(template_id)["query"]["sparql"]
+    for placeholder, value in values.items():
+        sparql = sparql.replace(placeholder, value)
+    return sparql
+
+
+VALUES = {
+    "?p1": "<https://dblp.org/rec/conf/sigmod/1>",
+    "?c1": "<https://dblp.org/pid/00/1>",
+    "?c2": "<https://dblp.org/pid/00/2>",
+    "[VENUE]": "'SIGMOD Conference'"
+}
+
+
+def test_bind_repeated_literal_slot():
+    for template_id in ("TC42", "TC44", "TC62"):
+        parameters = CompiledTemplate(template(template_id)).bind(fill(template_id, VALUES))
+        assert parameters is not None, template_id
+        assert parameters["VENUE"] == '"SIGMOD Conference"'
+        assert parameters["c1"] == "<https://dblp.org/pid/00/1>"
+
+
+def test_bind_rejects_different_repeated_values():
+    query = fill("TC42", {**VALUES, "[VENUE]": "'VLDB'"}).replace("'VLDB'", "'SIGMOD Conference'", 1)
+    assert CompiledTemplate(template("TC42")).bind(query) is None
+
+
+def test_union_templates_go_to_the_backend():
+    executor = TemplateExecutor(Graph())
+    assert "TC62" not in executor.compiled
+    assert executor.query("TC62", fill("TC62", VALUES)) is None
+    assert (executor.hits, executor.misses) == (0, 1)
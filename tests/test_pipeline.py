@@ -0,0 +1,49 @@
+import threading
+
+from pipeline import Writer
+
+
+def write_in_thread(writer, items, timeout=5):
+    """
+        Run writer.write in a thread and return the exception it raised,
+        failing the test if it does not finish within timeout seconds
+    """
+    outcome = {}
+
+    def run():
+        try:
+            writer.write(items)
+        except Exception as error:
+            outcome["error"] = error
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "write did not finish"
+    return outcome.get("error")
+
+
+def test_write_consumes_items_in_order():
+    written = []
+    assert write_in_thread(Writer(written.extend, 4), range(10)) is None
+    assert written == list(range(10))
+
+
+def test_error_before_last_item_is_raised():
+    def consume(items):
+        for item in items:
+            if item == 2:
+                raise ValueError("bad item")
+
+    error = write_in_thread(Writer(consume, 1), range(100))
+    assert isinstance(error, ValueError)
+
+
+def test_error_after_last_item_is_raised():
+    def consume(items):
+        for _ in items:
+            pass
+        raise OSError("close failed")
+
+    error = write_in_thread(Writer(consume, 4), range(3))
+    assert isinstance(error, OSError)
@@ -5,76 +5,247 @@ import re
 import os
 import json
 import logging
+from multiprocessing import Pool
 from tqdm import tqdm
 import numpy as np
-import matplotlib.pyplot as plt
 
-import seaborn as sns
-import pandas as pd
-
-from templates import templates
-from dblp import Graph
+from dblp import STORAGE_ENGINES, CSRGraph
+from preconditions import TemplateIndex
+from models import DataGenerator, Sample, ENTITY_TYPES, QUERY_TYPES, TEMPLATE_ENTITY_TYPES, load_nlp
+from keywords import KeywordIndex
+from cache import QueryCache
+from client import SPARQLClient, RateLimiter
+from pipeline import Writer
+from writers import JSONLinesWriter, JSONArrayWriter, convert_to_json
 
 logging.basicConfig(level=logging.INFO)
 
-def index_graph(path):
+GRAPH_FILES = {
+    "dict": "dblp.pkl",
+    "csr": "dblp.csr.pkl",
+    "mmap": "dblp.graph"
+}
+TEMPLATE_INDEX_FILE = "dblp.templates.npz"
+KEYWORD_INDEX_FILE = "dblp.keywords.npz"
+
+def index_graph(path, storage="mmap", workers=1):
     """
         Index graph from path
     """
-    g = Graph("DBLP")
-    g.load_from_ntriple(path)
-    g.save(os.join.path("dblp.pkl"))
+    # Mapped graphs are built in memory as CSR and then written out
+    g = CSRGraph("DBLP") if storage == "mmap" else STORAGE_ENGINES[storage]("DBLP")
+    if workers > 1:
+        g.load_from_ntriple_parallel(path, workers)
+    else:
+        g.load_from_ntriple(path)
+    acceptance_rate = g.build_valid_index("Publication")
+    logging.info(f" {acceptance_rate:.2%} of publications pass sample validation")
+    if storage == "mmap":
+        g.save_mapped(GRAPH_FILES[storage])
+    else:
+        g.save(GRAPH_FILES[storage])
+    TemplateIndex().build(g).save(TEMPLATE_INDEX_FILE)
+    build_keyword_index(g, workers).save(KEYWORD_INDEX_FILE)
+
+def build_keyword_index(graph, workers=1, _type="Publication"):
+    """
+        Extract the keywords of the titles of the publications that can be sampled
+    """
+    valid = len(graph.valid_index.get(_type, [])) > 0
+    titles = (
+        Sample(graph.subgraph(_type, graph.vertex_at(_type, position, valid))).title
+        for position in range(graph.pool_size(_type, valid)))
+    return KeywordIndex().build(titles, load_nlp(), workers)
 
-def load_graph():
+def load_graph(storage="mmap"):
     """
-        Load graph from pickle file
+        Load graph from graph file
     """
-    graph = Graph("DBLP")
+    graph = STORAGE_ENGINES[storage]("DBLP")
     logging.info(" Loading DBLP graph...")
-    graph.load_from_pickle("dblp.pkl")
+    if storage == "mmap":
+        graph.open(GRAPH_FILES[storage])
+    else:
+        graph.load_from_pickle(GRAPH_FILES[storage])
     logging.info(" DBLP graph loaded")
     return graph
 
-def add_to_json(file, id, doc):
+def load_template_index(graph=None):
+    """
+        Load the template precondition index if it has been built,
+        and if given the graph, only if it was built from that graph
+    """
+    if not os.path.exists(TEMPLATE_INDEX_FILE):
+        logging.info(" No template index found, sampling from all publications")
+        return None
+    index = TemplateIndex().load(TEMPLATE_INDEX_FILE)
+    if graph is not None and not index.matches(graph):
+        logging.warning(
+            f" {TEMPLATE_INDEX_FILE} was not built from the loaded graph, sampling from all publications. "
+            "Run --index to rebuild it")
+        return None
+    return index
+
+def load_keyword_index():
+    """
+        Load the keyword index if it has been built
+    """
+    if not os.path.exists(KEYWORD_INDEX_FILE):
+        logging.info(" No keyword index found, extracting keywords while generating")
+        return None
+    return KeywordIndex().load(KEYWORD_INDEX_FILE)
+
+def query_client(args, workers=1):
+    """
+        Build the query cache and SPARQL client from the command line arguments.
+        The request rate is shared between workers
+    """
+    cache = QueryCache(args.cache, args.cache_size * 1024 ** 2, args.cache_ttl) if args.cache else None
+    limiter = RateLimiter(rate=args.rate / workers if args.rate else None, max_concurrency=max(1, args.concurrency))
+    client = SPARQLClient(pool_size=max(16, args.concurrency), timeout=(5, args.timeout), retries=args.retries, limiter=limiter)
+    return cache, client
+
+def generate_shard(task):
+    """
+        Generate one shard of every group into JSON Lines files, in a worker process
+    """
+    shard, shards, args, data_size = task
+    cache, client = query_client(args, shards)
+    graph = load_graph(args.storage)
+    dataGenerator = DataGenerator(
+        graph, args.seed, load_template_index(graph), args.backend, args.compiled, cache, client, load_keyword_index())
+    files = {}
+    for group, size in data_size.items():
+        files[group] = os.path.join("data", f"{group}.shard{shard}.jsonl")
+        with open(files[group], "w", encoding="utf-8") as file:
+            def write(items):
+                for _, data, answer in items:
+                    file.write(json.dumps([data, answer], ensure_ascii=False) + "\n")
+            writer = Writer(write, args.queue_size)
+            writer.write(dataGenerator.generate(
+                group, size, args.concurrency, args.batch_size, shard, shards, args.fill_workers,
+                bucket_attempts=args.bucket_attempts, bucket_time=args.bucket_time, sample_reuse=args.sample_reuse,
+                lookahead=args.lookahead))
+            writer.report()
+    return files
+
+def merge_shards(files):
+    """
+        Yield the questions of the shard files bucket by bucket and shard by shard,
+        numbered with contiguous IDs
+    """
+    buckets = {}
+    for file in files:
+        with open(file, "r", encoding="utf-8") as f:
+            for line in f:
+                data, answer = json.loads(line)
+                bucket = (ENTITY_TYPES.index(TEMPLATE_ENTITY_TYPES[data["template_id"]]), QUERY_TYPES.index(data["query_type"]))
+                buckets.setdefault(bucket, []).append((data, answer))
+
+    valid_query_index = 0
+    invalid_query_index = 0
+    for bucket in sorted(buckets):
+        for data, answer in buckets[bucket]:
+            if is_valid_question(data, answer):
+                valid_query_index += 1
+                id = "Q"+str(valid_query_index).zfill(4)
+            else:
+                invalid_query_index += 1
+                id = "Q"+str(invalid_query_index).zfill(4)
+            yield id, data, answer
+
+def generate_sharded(args, data_size):
+    """
+        Generate the dataset in args.workers processes, each generating a range
+        of every bucket's question slots, and merge the shards
     """
-        Add a document to a json file
+    tasks = [(shard, args.workers, args, data_size) for shard in range(args.workers)]
+    with Pool(args.workers) as pool:
+        shard_files = pool.map(generate_shard, tasks)
+    for group in data_size:
+        files = [files[group] for files in shard_files]
+        logging.info(f"Merging {len(files)} shards of {group} questions")
+        save_to_json(
+            *output_files(group, args.output_format), merge_shards(files),
+            args.output_format, args.compression, args.shard_size * 1024 ** 2 or None)
+        for file in files:
+            os.remove(file)
+
+def is_valid_question(data, answer):
     """
-    _doc = {"id": id, **doc}
-    json.dump(_doc, file, indent=4, ensure_ascii=False)
-    file.write(",\n")
+        Whether a generated question has answers and all of its slots filled
+    """
+    return (
+        answer["answer"] and
+        not re.search("NONE", data["question"]["string"]) and
+        not re.search("NONE", data["paraphrased_question"]["string"])
+    )
 
+def output_files(group, output_format="json"):
+    """
+        Names of the questions, answers and failed queries files of a group.
+        JSON Lines output keeps the failed queries of each group apart
+    """
+    failed_queries_file = "failed_queries.json" if output_format == "json" else group+"_failed_queries.json"
+    return group+"_questions.json", group+"_answers.json", failed_queries_file
 
-def save_to_json(data_file, answers_file, failed_queries_file, dataGenerator):
+def record_writer(file, key, output_format="json", compression=None, shard_size=None, resume=None):
     """
-        Save data to a json file
+        Open a writer of records to a data file, as a JSON array under key
+        or as JSON Lines shards named after the file, continuing from the
+        writer position resume if given
     """
-    with open(os.path.join("data", data_file), "w", encoding="utf-8") as data_file:
-        with open(os.path.join("data", failed_queries_file), "w", encoding="utf-8") as failed_queries_file:
-            with open(os.path.join("data", answers_file), "w", encoding="utf-8") as answers_file:
-                data_file.write('{\n"questions": [')
-                answers_file.write('{\n"answers": [')
-                failed_queries_file.write('{\n"failed_queries": [')
-                for id, data, answer in tqdm(dataGenerator, desc="Generating data: "):
-                    if (
-                        answer["answer"] and 
-                        not re.search("NONE", data["question"]["string"]) and 
-                        not re.search("NONE", data["paraphrased_question"]["string"])
-                    ):
-                        add_to_json(data_file, id, data)
-                        add_to_json(answers_file, id, answer)
-                    else:
-                        add_to_json(failed_queries_file, id, data)
-                data_file.seek(data_file.tell() - 2, 0)
-                data_file.truncate()
-                data_file.write("\n]}")
+    path = os.path.join("data", file)
+    if output_format == "jsonl":
+        return JSONLinesWriter(os.path.splitext(path)[0], shard_size, compression, resume=resume)
+    return JSONArrayWriter(path, key, resume)
 
-                answers_file.seek(answers_file.tell() - 2, 0)
-                answers_file.truncate()
-                answers_file.write("\n]}")
+def checkpoint_file(group):
+    """
+        Name of the checkpoint file of a group
+    """
+    return os.path.join("data", group+".checkpoint.json")
 
-                failed_queries_file.seek(failed_queries_file.tell() - 2, 0)
-                failed_queries_file.truncate()
-                failed_queries_file.write("\n]}")
+def save_to_json(data_file, answers_file, failed_queries_file, dataGenerator, output_format="json", compression=None, shard_size=None,
+                 checkpoint=None):
+    """
+        Save data to json files, or to JSON Lines shards of shard_size bytes.
+        With a checkpoint, writing continues from its writer positions and
+        the checkpoint is saved as it comes due
+    """
+    options = (output_format, compression, shard_size)
+    outputs = checkpoint.state["outputs"] if checkpoint else {}
+    with record_writer(data_file, "questions", *options, outputs.get("questions")) as data_writer, \
+            record_writer(answers_file, "answers", *options, outputs.get("answers")) as answers_writer, \
+            record_writer(failed_queries_file, "failed_queries", *options, outputs.get("failed_queries")) as failed_queries_writer:
+
+        def positions():
+            return {
+                "questions": data_writer.position(),
+                "answers": answers_writer.position(),
+                "failed_queries": failed_queries_writer.position()
+            }
+
+        for id, data, answer in tqdm(dataGenerator, desc="Generating data: "):
+            valid = is_valid_question(data, answer)
+            if valid:
+                data_writer.write({"id": id, **data})
+                answers_writer.write({"id": id, **answer})
+            else:
+                failed_queries_writer.write({"id": id, **data})
+            if checkpoint and checkpoint.record(TEMPLATE_ENTITY_TYPES[data["template_id"]], data["query_type"], valid):
+                checkpoint.save(positions())
+        if checkpoint:
+            checkpoint.save(positions(), done=True)
+
+def convert_outputs(groups):
+    """
+        Convert the JSON Lines outputs of the groups to json files
+    """
+    for group in groups:
+        for file, key in zip(output_files(group, "jsonl"), ("questions", "answers", "failed_queries")):
+            path = os.path.join("data", file)
+            convert_to_json(os.path.splitext(path)[0], path, key)
 
 def save_paraphrases_json(filename, generator):
     """
@@ -100,6 +271,9 @@ def compute_data_distribution():
     """
         Compute the distribution of data
     """
+    # Plotting and data frame libraries are only needed here
+    import seaborn as sns
+    import pandas as pd
 
     pd.set_option('display.max_columns', None)
 
@@ -0,0 +1,193 @@
+"""
+    Streaming writers of generated records: JSON Lines shards, optionally
+    compressed, and the indented JSON array format of the released dataset
+"""
+import os
+import glob
+import gzip
+import json
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+COMPRESSION_EXTENSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def open_file(path, mode="rt"):
+    """
+        Open a text file, compressed with gzip or zstd according to its extension
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading or writing .zst files needs the zstandard package") from None
+        return zstandard.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def shard_files(name):
+    """
+        Return the JSON Lines shards written under a name, in order
+    """
+    return sorted(glob.glob(glob.escape(name) + "-[0-9][0-9][0-9][0-9][0-9].jsonl*"))
+
+
+def read_json_lines(name):
+    """
+        Yield the records of the JSON Lines shards written under a name
+    """
+    for path in shard_files(name):
+        with open_file(path, "rt") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class JSONLinesWriter:
+    """
+        Records written one per line to shards name-00000.jsonl, name-00001.jsonl, ...
+        starting a new shard once the current one holds max_size bytes of JSON.
+        With append, writing resumes in a new shard after the existing ones,
+        with resume it continues from a position returned by position,
+        otherwise existing shards are removed
+    """
+    def __init__(self, name, max_size=None, compression=None, append=False, resume=None):
+        self.name = name
+        self.max_size = max_size
+        self.extension = ".jsonl" + COMPRESSION_EXTENSIONS[compression]
+        self.files = shard_files(name)
+        self.path = None
+        self.file = None
+        self.size = 0
+        self.count = 0
+        if resume:
+            # Shards started after the position are dropped and the last one is cut back to it
+            for path in self.files:
+                if path not in resume["files"]:
+                    os.remove(path)
+            self.files = list(resume["files"])
+            self.path = self.files[-1] if self.files else None
+            if self.path:
+                with open(self.path, "r+b") as f:
+                    f.truncate(resume["offset"])
+            self.size = resume["size"]
+            self.count = resume["count"]
+        elif not append:
+            for path in self.files:
+                os.remove(path)
+            self.files = []
+        self.shard = int(self.files[-1][len(name) + 1:len(name) + 6]) + 1 if self.files else 0
+
+    def __repr__(self):
+        return f"JSONLinesWriter(name={self.name}, shards={len(self.files)}, records={self.count})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __open(self):
+        # Continue the current shard unless it is full, compressed shards in a new gzip member or zstd frame
+        if self.path is None or (self.max_size and self.size >= self.max_size):
+            self.path = f"{self.name}-{self.shard:05d}{self.extension}"
+            self.files.append(self.path)
+            self.shard += 1
+            self.size = 0
+            self.file = open_file(self.path, "wt")
+        else:
+            self.file = open_file(self.path, "at")
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        if self.file and self.max_size and self.size >= self.max_size:
+            self.close()
+        if self.file is None:
+            self.__open()
+        self.file.write(line)
+        self.size += len(line.encode("utf-8"))
+        self.count += 1
+
+    def position(self):
+        """
+            Return the position after the records written so far. The shard is
+            closed to end its compressed stream there and reopened on the next write
+        """
+        self.close()
+        return {
+            "files": list(self.files),
+            "offset": os.path.getsize(self.path) if self.path else 0,
+            "size": self.size,
+            "count": self.count
+        }
+
+    def flush(self):
+        if self.file:
+            self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class JSONArrayWriter:
+    """
+        Records written as an indented JSON array under a key of one JSON object,
+        continuing from a position returned by position if resume is given
+    """
+    def __init__(self, path, key, resume=None):
+        self.path = path
+        if resume:
+            self.file = open(path, "r+", encoding="utf-8")
+            self.file.seek(resume["offset"])
+            self.file.truncate()
+            self.count = resume["count"]
+        else:
+            self.file = open(path, "w", encoding="utf-8")
+            self.file.write('{\n"' + key + '": [')
+            self.count = 0
+
+    def __repr__(self):
+        return f"JSONArrayWriter(path={self.path}, records={self.count})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, record):
+        if self.count:
+            self.file.write(",\n")
+        json.dump(record, self.file, indent=4, ensure_ascii=False)
+        self.count += 1
+
+    def position(self):
+        """
+            Return the position after the records written so far
+        """
+        self.file.flush()
+        return {"offset": self.file.tell(), "count": self.count}
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write("\n]}")
+            self.file.close()
+
+
+def convert_to_json(name, path, key):
+    """
+        Write the records of the JSON Lines shards under a name to a JSON array file
+    """
+    with JSONArrayWriter(path, key) as writer:
+        for record in read_json_lines(name):
+            writer.write(record)
+    logging.info(f" Converted {writer.count} records from {name} to {path}")
+    return writer.count